@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+
+import heapq
+from array import array
+
+from CircuitSimulator import CircuitSimulator
+
+
+class Aig:
+    """An And-Inverter Graph: a circuit of two-input AND nodes with optionally complemented edges.
+
+    The nodes are stored in flat arrays (the fanin literals and the level of each node); node 0 is the constant
+    False, and the inputs have no fanins. A literal is 2*node+1 for the complemented edge and 2*node otherwise
+    (thus, 0 is False and 1 is True). The AND nodes are structurally hashed (a node for the same pair of fanin
+    literals is created only once), and the constants and the trivial cases (a&a, a&-a) are propagated.
+    Since a node is created after its fanins, the node order is topological.
+
+    The graph is built from a SatMemory circuit by from_circuit() (And/Or/XorGate/MajorityGate are decomposed into
+    AND nodes) and optimized by balanced() and rewritten(); insert_clauses() emits the CNF of the graph.
+    """
+
+    FALSE = 0
+    TRUE = 1
+    INPUT = -1  # the fanin value of the inputs
+    CUT_SIZE = 4  # the number of the leaves of the cuts considered by rewritten()
+    MAX_CUTS = 8  # the number of the cuts stored for each node by rewritten()
+    VAR_TRUTH_TABLES = (0xAAAA, 0xCCCC, 0xF0F0, 0xFF00)  # the truth tables of the 4 cut leaves
+    TRUTH_TABLE_MASK = 0xFFFF
+
+    def __init__(self):
+        self.fanin0 = array('i', [0])
+        self.fanin1 = array('i', [0])
+        self.levels = array('i', [0])
+        self.strash = {}  # fanin0 * 2^32 + fanin1 -> node (for fanin0 < fanin1)
+        self.inputs = []  # input nodes
+        self.input_vars = []  # the SAT variable index of each input
+        self.outputs = []  # output literals
+
+    def add_input(self, var):
+        node = len(self.fanin0)
+        self.fanin0.append(Aig.INPUT)
+        self.fanin1.append(Aig.INPUT)
+        self.levels.append(0)
+        self.inputs.append(node)
+        self.input_vars.append(var)
+        return 2 * node
+
+    def is_and(self, node):
+        return node > 0 and self.fanin0[node] != Aig.INPUT
+
+    def and_(self, a, b):
+        if a > b:
+            a, b = b, a
+        if a == Aig.FALSE or a == b ^ 1:
+            return Aig.FALSE
+        if a == Aig.TRUE or a == b:
+            return b
+        key = (a << 32) | b
+        node = self.strash.get(key)
+        if node is None:
+            node = len(self.fanin0)
+            self.fanin0.append(a)
+            self.fanin1.append(b)
+            self.levels.append(1 + max(self.levels[a >> 1], self.levels[b >> 1]))
+            self.strash[key] = node
+        return 2 * node
+
+    def or_(self, a, b):
+        return self.and_(a ^ 1, b ^ 1) ^ 1
+
+    def xor(self, a, b):
+        return self.or_(self.and_(a, b ^ 1), self.and_(a ^ 1, b))
+
+    def majority(self, a, b, c):
+        return self.or_(self.and_(a, b), self.and_(c, self.or_(a, b)))
+
+    def number_of_ands(self):
+        return len(self.fanin0) - 1 - len(self.inputs)
+
+    def depth(self):
+        return max((self.levels[lit >> 1] for lit in self.outputs), default=0)
+
+    @staticmethod
+    def from_circuit(sat_memory, outputs):
+        """Builds the AIG of the given formulas (see CircuitSimulator); the free variables of sat_memory become
+        the inputs (in the order of their indices)."""
+        simulator = CircuitSimulator(sat_memory, outputs)
+        aig = Aig()
+        literals = [Aig.FALSE] * simulator.n_slots  # slot -> AIG literal
+        for v in sorted(set(range(1, sat_memory.n_free_vars + 1)) | set(simulator.inputs)):
+            lit = aig.add_input(v)
+            if v in simulator.inputs:
+                literals[simulator.inputs[v]] = lit
+        for slot, operator, operands, inverted in simulator.gates:
+            xs = [literals[s] ^ 1 if inv else literals[s] for s, inv in operands]
+            if operator == CircuitSimulator.MAJ:
+                lit = aig.majority(*xs)
+            else:
+                combine = {CircuitSimulator.AND: aig.and_, CircuitSimulator.OR: aig.or_,
+                           CircuitSimulator.XOR: aig.xor}[operator]
+                lit = xs[0]
+                for x in xs[1:]:
+                    lit = combine(lit, x)
+            literals[slot] = lit ^ 1 if inverted else lit
+        aig.outputs = [literals[slot] ^ 1 if inv else literals[slot] for slot, inv in simulator.outputs]
+        return aig
+
+    def new_graph(self):
+        # an empty AIG with the same inputs; returns (aig, old node -> new literal)
+        aig = Aig()
+        mapping = {0: Aig.FALSE}
+        for node, var in zip(self.inputs, self.input_vars):
+            mapping[node] = aig.add_input(var)
+        return aig, mapping
+
+    @staticmethod
+    def mapped(mapping, lit):
+        return mapping[lit >> 1] ^ (lit & 1)
+
+    def references(self):
+        """Returns (node -> the number of references from the AND nodes and the outputs reachable from the outputs,
+        the set of the nodes referenced by the outputs or by complemented edges)."""
+        refs = array('i', [0]) * len(self.fanin0)
+        special = set()
+        for lit in self.outputs:
+            refs[lit >> 1] += 1
+            special.add(lit >> 1)
+        for node in range(len(self.fanin0) - 1, 0, -1):  # in the reverse topological order
+            if refs[node] > 0 and self.is_and(node):
+                for lit in (self.fanin0[node], self.fanin1[node]):
+                    refs[lit >> 1] += 1
+                    if lit & 1:
+                        special.add(lit >> 1)
+        return refs, special
+
+    def balanced(self):
+        """Returns the AIG, in which each maximal multi-input AND (the AND nodes connected by the uncomplemented
+        edges with a single reference) is rebuilt as a tree of the minimal depth (by joining the two shallowest
+        operands first)."""
+        refs, special = self.references()
+        aig, mapping = self.new_graph()
+        for node in range(1, len(self.fanin0)):
+            if refs[node] == 0 or not self.is_and(node) or (refs[node] == 1 and node not in special):
+                continue  # the inner nodes of multi-input ANDs are collected by their roots
+            leaves = []
+            stack = [self.fanin0[node], self.fanin1[node]]
+            while len(stack) > 0:
+                lit = stack.pop()
+                child = lit >> 1
+                if not (lit & 1) and self.is_and(child) and refs[child] == 1 and child not in special:
+                    stack.append(self.fanin0[child])
+                    stack.append(self.fanin1[child])
+                else:
+                    leaves.append(Aig.mapped(mapping, lit))
+            heap = [(aig.levels[lit >> 1], lit) for lit in set(leaves)]
+            heapq.heapify(heap)
+            while len(heap) > 1:
+                a = heapq.heappop(heap)[1]
+                b = heapq.heappop(heap)[1]
+                lit = aig.and_(a, b)
+                heapq.heappush(heap, (aig.levels[lit >> 1], lit))
+            mapping[node] = heap[0][1]
+        aig.outputs = [Aig.mapped(mapping, lit) for lit in self.outputs]
+        return aig.cleaned()
+
+    def cleaned(self):
+        """Returns the copy of the AIG without the nodes not reachable from the outputs."""
+        refs, special = self.references()
+        aig, mapping = self.new_graph()
+        for node in range(1, len(self.fanin0)):
+            if refs[node] > 0 and self.is_and(node):
+                mapping[node] = aig.and_(Aig.mapped(mapping, self.fanin0[node]),
+                                         Aig.mapped(mapping, self.fanin1[node]))
+        aig.outputs = [Aig.mapped(mapping, lit) for lit in self.outputs]
+        return aig
+
+    def cuts(self, refs):
+        """Enumerates the cuts (up to CUT_SIZE leaves, up to MAX_CUTS smallest ones per node) of the reachable
+        AND nodes; returns node -> the list of cuts (sorted tuples of leaf nodes)."""
+        cuts = {}
+        for node in self.inputs:
+            cuts[node] = [(node,)]
+        for node in range(1, len(self.fanin0)):
+            if refs[node] == 0 or not self.is_and(node):
+                continue
+            merged = set()
+            for c0 in cuts[self.fanin0[node] >> 1]:
+                for c1 in cuts[self.fanin1[node] >> 1]:
+                    leaves = set(c0)
+                    leaves.update(c1)
+                    if len(leaves) <= Aig.CUT_SIZE:
+                        merged.add(tuple(sorted(leaves)))
+            cuts[node] = [(node,)] + sorted(merged, key=len)[:Aig.MAX_CUTS - 1]
+        return cuts
+
+    def truth_table(self, node, leaves):
+        # the truth table of the node as a function of the cut leaves
+        values = {leaf: Aig.VAR_TRUTH_TABLES[i] for i, leaf in enumerate(leaves)}
+        stack = [node]
+        while len(stack) > 0:
+            n = stack[-1]
+            if n in values:
+                stack.pop()
+                continue
+            pending = [lit >> 1 for lit in (self.fanin0[n], self.fanin1[n]) if (lit >> 1) not in values]
+            if len(pending) > 0:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            a, b = self.fanin0[n], self.fanin1[n]
+            va = values[a >> 1] ^ (Aig.TRUTH_TABLE_MASK if a & 1 else 0)
+            vb = values[b >> 1] ^ (Aig.TRUTH_TABLE_MASK if b & 1 else 0)
+            values[n] = va & vb
+        return values[node]
+
+    def mffc(self, node, leaves, refs):
+        """Returns the nodes of the maximum fanout-free cone of the node (the nodes, which would become
+        unreferenced, if the node was removed) above the cut leaves."""
+        result = [node]
+        changed = []
+        stack = [node]
+        while len(stack) > 0:
+            n = stack.pop()
+            for lit in (self.fanin0[n], self.fanin1[n]):
+                child = lit >> 1
+                if child in leaves or not self.is_and(child):
+                    continue
+                refs[child] -= 1
+                changed.append(child)
+                if refs[child] == 0:
+                    result.append(child)
+                    stack.append(child)
+        for child in changed:
+            refs[child] += 1
+        return result
+
+    @staticmethod
+    def isop(on, upper, n_vars):
+        """Computes an irredundant sum of products (Minato-Morreale) of a function f with on <= f <= upper
+        (the truth tables over the first n_vars cut leaves).
+
+        :return: (the list of cubes, each being a list of (leaf index, polarity), the truth table of the cover)
+        """
+        if on == 0:
+            return [], 0
+        if upper == Aig.TRUTH_TABLE_MASK:
+            return [[]], Aig.TRUTH_TABLE_MASK
+        i = n_vars - 1
+        while True:
+            mask = Aig.VAR_TRUTH_TABLES[i]
+            shift = 1 << i
+            if ((on & mask) >> shift) != (on & ~mask) or ((upper & mask) >> shift) != (upper & ~mask):
+                break  # the function depends on the leaf i
+            i -= 1
+        mask = Aig.VAR_TRUTH_TABLES[i]
+        shift = 1 << i
+
+        def cofactor0(tt):
+            return (tt & ~mask & Aig.TRUTH_TABLE_MASK) | ((tt & ~mask & Aig.TRUTH_TABLE_MASK) << shift)
+
+        def cofactor1(tt):
+            return (tt & mask) | ((tt & mask) >> shift)
+
+        on0, on1 = cofactor0(on), cofactor1(on)
+        upper0, upper1 = cofactor0(upper), cofactor1(upper)
+        cubes0, cover0 = Aig.isop(on0 & ~upper1 & Aig.TRUTH_TABLE_MASK, upper0, i)
+        cubes1, cover1 = Aig.isop(on1 & ~upper0 & Aig.TRUTH_TABLE_MASK, upper1, i)
+        rest = ((on0 & ~cover0) | (on1 & ~cover1)) & Aig.TRUTH_TABLE_MASK
+        cubes2, cover2 = Aig.isop(rest, upper0 & upper1, i)
+        cover = (cover0 & ~mask) | (cover1 & mask) | cover2
+        cubes = [c + [(i, False)] for c in cubes0] + [c + [(i, True)] for c in cubes1] + cubes2
+        return cubes, cover & Aig.TRUTH_TABLE_MASK
+
+    def trial_and(self, a, b, trial):
+        # and_() without creating nodes: the new nodes are recorded in trial (fanin key -> the node id beyond
+        # the existing nodes); trial["used"] collects the existing nodes reached
+        if a > b:
+            a, b = b, a
+        if a == Aig.FALSE or a == b ^ 1:
+            return Aig.FALSE
+        if a == Aig.TRUE or a == b:
+            return b
+        key = (a << 32) | b
+        node = self.strash.get(key)
+        if node is not None:
+            trial["used"].add(node)
+            return 2 * node
+        node = trial.get(key)
+        if node is None:
+            node = trial[key] = len(self.fanin0) + len(trial) - 1
+        return 2 * node
+
+    def synthesized(self, cubes, complemented, leaf_literals, and_function):
+        # builds the OR of the cubes (complemented, if required) over the given leaf literals
+        terms = []
+        for cube in cubes:
+            lit = Aig.TRUE
+            for i, polarity in cube:
+                lit = and_function(lit, leaf_literals[i] if polarity else leaf_literals[i] ^ 1)
+            terms.append(lit)
+        result = Aig.TRUE  # the OR of the terms is built as NOT(AND(NOT terms))
+        for lit in terms:
+            result = and_function(result, lit ^ 1)
+        return result if complemented else result ^ 1
+
+    def rewritten(self):
+        """Returns the AIG, in which each node is replaced by the sum of products (of the function or of its
+        complement) of a cut of at most CUT_SIZE leaves, if that saves nodes: the new nodes (not yet present
+        in the graph) are counted against the nodes of the maximum fanout-free cone freed by the replacement."""
+        refs, special = self.references()
+        cuts = self.cuts(refs)
+        aig, mapping = self.new_graph()
+        for node in range(1, len(self.fanin0)):
+            if refs[node] == 0 or not self.is_and(node):
+                continue
+            best = None
+            best_gain = 0
+            for leaves in cuts[node][1:]:
+                freed = self.mffc(node, set(leaves), refs)
+                tt = self.truth_table(node, leaves)
+                leaf_literals = [mapping[leaf] for leaf in leaves]
+                images = set(mapping[n] >> 1 for n in freed[1:] if n in mapping)
+                for complemented in (False, True):
+                    on = tt ^ Aig.TRUTH_TABLE_MASK if complemented else tt
+                    cubes = Aig.isop(on, on, len(leaves))[0]
+                    trial = {"used": set()}
+                    aig.synthesized(cubes, complemented, leaf_literals,
+                                    lambda a, b: aig.trial_and(a, b, trial))
+                    gain = len(freed) - (len(trial) - 1) - len(trial["used"] & images)
+                    if gain > best_gain:
+                        best, best_gain = (cubes, complemented, leaf_literals), gain
+            if best is not None:
+                mapping[node] = aig.synthesized(*best, aig.and_)
+            else:
+                mapping[node] = aig.and_(Aig.mapped(mapping, self.fanin0[node]),
+                                         Aig.mapped(mapping, self.fanin1[node]))
+        aig.outputs = [Aig.mapped(mapping, lit) for lit in self.outputs]
+        aig = aig.cleaned()
+        return aig if aig.number_of_ands() <= self.number_of_ands() else self
+
+    def optimized(self):
+        """Balances, rewrites, and balances the AIG again; prints the statistics."""
+        aig = self.balanced().rewritten().balanced()
+        print("aig: #ands " + str(self.number_of_ands()) + " -> " + str(aig.number_of_ands()) +
+              ", depth " + str(self.depth()) + " -> " + str(aig.depth()))
+        return aig
+
+    def and_fanins(self, lit):
+        # the fanins of the AND node of lit (None for the inputs and the constants)
+        node = lit >> 1
+        if not self.is_and(node):
+            return None
+        return self.fanin0[node], self.fanin1[node]
+
+    def recognized_gates(self, refs):
+        """Recognizes the XOR and majority gates decomposed into AND nodes (as by xor() and majority()).
+
+        :return: node -> ("xor", operand literals, inverted) or ("maj", operand literals, inverted), where the node
+            is equal to the gate of the operands, or to its negation (if inverted)
+        """
+        gates = {}
+        for node in range(1, len(self.fanin0)):
+            if refs[node] == 0 or not self.is_and(node):
+                continue
+            f0, f1 = self.fanin0[node], self.fanin1[node]
+            if not (f0 & 1) or not (f1 & 1):
+                continue
+            g, h = self.and_fanins(f0), self.and_fanins(f1)
+            if g is None or h is None:
+                continue
+            if h == (g[0] ^ 1, g[1] ^ 1):
+                # -(a&b) & -(-a&-b) = a^b (the fanins are sorted, thus, in the same order)
+                operands, inverted = [g[0], g[1]], False
+                for i, lit in enumerate(operands):
+                    inner_gate = gates.get(lit >> 1)
+                    if inner_gate is not None and inner_gate[0] == "xor" and len(inner_gate[1]) == 2 and \
+                            refs[lit >> 1] == 2:
+                        # (x^y)^b = x^y^b, if x^y is referenced only by the inner nodes of this XOR
+                        operands = operands[:i] + inner_gate[1] + operands[i + 1:]
+                        inverted ^= bool(lit & 1) ^ inner_gate[2]
+                        break
+                gates[node] = ("xor", operands, inverted)
+                continue
+            for t1, t3_fanins in ((g, h), (h, g)):
+                # -(a&b) & -(c & -(-a&-b)) = -maj(a,b,c)
+                for c, t2 in (t3_fanins, t3_fanins[::-1]):
+                    if (t2 & 1) and self.and_fanins(t2) == (t1[0] ^ 1, t1[1] ^ 1):
+                        gates[node] = ("maj", [t1[0], t1[1], c], True)
+                        break
+                if node in gates:
+                    break
+        return gates
+
+    def insert_clauses(self, result, n_fixed):
+        """Inserts the Tseitin clauses of the nodes reachable from the outputs into result (e.g., SatClauses).
+
+        The recognized XOR and majority gates (see recognized_gates()) and the multi-input ANDs (as in balanced())
+        are encoded directly, like XorGate, MajorityGate, and And in CNF; their inner nodes get variables only if
+        they are used elsewhere.
+
+        :param n_fixed: the inputs keep their variable indices (at most n_fixed); the encoded nodes get
+            the variables n_fixed+1, n_fixed+2, ... (in the topological order)
+        :return: (the output literals: signed variable indices, or "True"/"False" for constants, the number of
+            variables)
+        """
+        refs, special = self.references()
+        gates = self.recognized_gates(refs)
+        needed = set(lit >> 1 for lit in self.outputs)
+        for node in range(len(self.fanin0) - 1, 0, -1):  # the users are visited before the used nodes
+            if node not in needed or not self.is_and(node):
+                continue
+            if node not in gates:
+                leaves = []
+                stack = [self.fanin0[node], self.fanin1[node]]
+                while len(stack) > 0:
+                    lit = stack.pop()
+                    child = lit >> 1
+                    if not (lit & 1) and self.is_and(child) and refs[child] == 1 and child not in special and \
+                            child not in gates:
+                        stack.append(self.fanin0[child])
+                        stack.append(self.fanin1[child])
+                    else:
+                        leaves.append(lit)
+                gates[node] = ("and", leaves, False)
+            needed.update(lit >> 1 for lit in gates[node][1])
+
+        variables = {node: var for node, var in zip(self.inputs, self.input_vars)}
+        n_vars = n_fixed
+
+        def literal(lit):
+            v = variables[lit >> 1]
+            return -v if lit & 1 else v
+
+        for node in range(1, len(self.fanin0)):
+            if node not in needed or not self.is_and(node):
+                continue
+            n_vars += 1
+            variables[node] = n_vars
+            kind, operands, inverted = gates[node]
+            z = -n_vars if inverted else n_vars  # z is equal to the gate
+            xs = [literal(lit) for lit in operands]
+            if kind == "and":
+                result.insert([z] + [-x for x in xs])
+                for x in xs:
+                    result.insert([-z, x])
+            elif kind == "xor":
+                for assignment in range(1 << len(xs)):
+                    parity = bin(assignment).count("1") % 2 == 1
+                    result.insert([-x if (assignment >> i) & 1 else x for i, x in enumerate(xs)] +
+                                  [z if parity else -z])
+            else:
+                a, b, c = xs
+                for x, y in ((a, b), (a, c), (b, c)):
+                    result.insert([-x, -y, z])
+                    result.insert([x, y, -z])
+
+        outputs = []
+        for lit in self.outputs:
+            if lit >> 1 == 0:
+                outputs.append("True" if lit == Aig.TRUE else "False")
+            else:
+                outputs.append(literal(lit))
+        return outputs, max(n_vars, max(self.input_vars, default=0))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from BitUtils import *
+from Primes import random_semiprime
+from SatInteger import SatInteger
+from PrimesProductToSAT import factor_widths, factor_vars, generate, template_for
+
+
+def manifest_jobs(filename):
+    """Reads the instances from the manifest: each line contains either "<p> <q>", or "<n> <#bits-of-p> <#bits-of-q>"
+    (as the arguments of PrimesProductToSAT.py); empty lines and lines starting with # are ignored."""
+    jobs = []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line[0] == "#":
+                continue
+            numbers = [int(s) for s in line.split()]
+            if len(numbers) == 2:
+                p, q = max(numbers), min(numbers)
+                if q <= 1:
+                    raise Exception("<p> and <q> must be positive factors greater than 1 in the line: " + line)
+                jobs.append({"n": p * q, "p": p, "q": q, "p_bits": bits_required(p), "q_bits": bits_required(q)})
+            elif len(numbers) == 3:
+                jobs.append({"n": numbers[0], "p": None, "q": None, "p_bits": numbers[1], "q_bits": numbers[2]})
+            else:
+                raise Exception("Invalid manifest line: " + line)
+    return jobs
+
+
+def random_jobs(k, bits, seed):
+    """Samples k random semiprimes with the given number of bits. The i-th semiprime depends only on seed and i."""
+    jobs = []
+    for i in range(k):
+        instance_seed = str(seed) + ":" + str(i)
+        n, p, q = random_semiprime(bits, random.Random(instance_seed))
+        jobs.append({"n": n, "p": p, "q": q, "p_bits": bits_required(p), "q_bits": bits_required(q),
+                     "seed": instance_seed})
+    return jobs
+
+
+def generate_job(job):
+    """Generates the instance for the given job (in a worker process); returns the job with the index entry fields."""
+    p_bits, q_bits = factor_widths(job["p_bits"], job["q_bits"], job["pad"])
+    start = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        n_vars, n_clauses = generate(job["filename"], job["n"], p_bits, q_bits, job["p"], job["q"],
+                                     job["template_dir"], polarity_aware=job["polarity_aware"], adder=job["adder"],
+                                     schoolbook_bits=job["schoolbook_bits"], multiplier=job["multiplier"],
+                                     toom3_bits=job["toom3_bits"], base_multiplier=job["base_multiplier"],
+                                     simplify=job["simplify"], renumber=job["renumber"], sweep=job["sweep"],
+                                     aig=job["aig"])
+    p_vars, q_vars = factor_vars(p_bits, q_bits)
+    entry = {"file": os.path.basename(job["filename"]), "n": job["n"], "p": job["p"], "q": job["q"],
+             "seed": job.get("seed"), "n_vars": n_vars, "n_clauses": n_clauses,
+             "p_vars": p_vars, "q_vars": q_vars, "time": round(time.time() - start, 3)}
+    return entry
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Generates SAT instances for factoring in parallel. The instances are written into the output "
+                    "directory together with index.jsonl, each line of which describes an instance: the file name, "
+                    "n, its factors (if known), the sampling seed, and the variables for the bits of the factors "
+                    "(right-to-left).")
+    parser.add_argument("output_dir")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="a file with one instance per line: <p> <q>, or <n> <#bits-of-p> "
+                                           "<#bits-of-q>")
+    source.add_argument("--random", type=int, metavar="K", help="generate K random semiprimes (see --bits)")
+    parser.add_argument("--bits", type=int, help="the number of bits of the random semiprimes")
+    parser.add_argument("--seed", default="0", help="the seed for sampling the random semiprimes (default: 0)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="the number of worker processes "
+                                                                         "(default: the number of CPUs)")
+    parser.add_argument("--template-dir", help="the directory of the CNF templates (see PrimesProductToSAT.py)")
+    parser.add_argument("--polarity-aware", action="store_true",
+                        help="use the Plaisted-Greenbaum encoding (see PrimesProductToSAT.py)")
+    parser.add_argument("--adder", choices=SatInteger.ADDERS, default="ripple",
+                        help="the adder architecture (see PrimesProductToSAT.py)")
+    parser.add_argument("--schoolbook-bits", type=int, default=SatInteger.SCHOOLBOOK_BITS,
+                        help="the schoolbook multiplication threshold (see PrimesProductToSAT.py)")
+    parser.add_argument("--base-multiplier", choices=SatInteger.BASE_MULTIPLIERS, default="array",
+                        help="the multiplier below the schoolbook threshold (see PrimesProductToSAT.py)")
+    parser.add_argument("--multiplier", choices=SatInteger.MULTIPLIERS, default="karatsuba",
+                        help="the multiplication algorithm (see PrimesProductToSAT.py)")
+    parser.add_argument("--toom3-bits", type=int, default=SatInteger.TOOM3_BITS,
+                        help="the Toom-3 threshold (see PrimesProductToSAT.py)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="merge the equivalent nodes of the circuit (see PrimesProductToSAT.py)")
+    parser.add_argument("--aig", action="store_true",
+                        help="optimize the circuit as an AIG and emit the CNF from it (see PrimesProductToSAT.py)")
+    parser.add_argument("--simplify", action="store_true",
+                        help="simplify the instances, keeping the variables of the factors (see PrimesProductToSAT.py)")
+    parser.add_argument("--keep-indices", action="store_true",
+                        help="do not renumber the auxiliary variables (see PrimesProductToSAT.py)")
+    parser.add_argument("--pad", action="store_true",
+                        help="extend both factors to the same power-of-2 width (see PrimesProductToSAT.py)")
+    args = parser.parse_args()
+
+    if args.manifest is not None:
+        jobs = manifest_jobs(args.manifest)
+    else:
+        if args.bits is None:
+            parser.error("--random requires --bits")
+        jobs = random_jobs(args.random, args.bits, args.seed)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    digits = len(str(len(jobs)))
+    for i, job in enumerate(jobs):
+        job["filename"] = os.path.join(args.output_dir, str(i).zfill(digits) + "_" + str(job["n"]) + ".cnf")
+        job["template_dir"] = args.template_dir
+        job["polarity_aware"] = args.polarity_aware
+        job["adder"] = args.adder
+        job["schoolbook_bits"] = args.schoolbook_bits
+        job["pad"] = args.pad
+        job["multiplier"] = args.multiplier
+        job["toom3_bits"] = args.toom3_bits
+        job["base_multiplier"] = args.base_multiplier
+        job["simplify"] = args.simplify
+        job["renumber"] = not args.keep_indices
+        job["sweep"] = args.sweep
+        job["aig"] = args.aig
+
+    if args.template_dir is not None:
+        # building the missing templates once, before the workers need them
+        for p_bits, q_bits in sorted({factor_widths(job["p_bits"], job["q_bits"], args.pad) for job in jobs}):
+            template_for(p_bits, q_bits, True, args.template_dir, args.polarity_aware, args.adder,
+                         args.schoolbook_bits, args.multiplier, args.toom3_bits, args.base_multiplier,
+                         not args.keep_indices, args.sweep, args.aig)
+
+    start = time.time()
+    with multiprocessing.Pool(args.jobs) as pool, open(os.path.join(args.output_dir, "index.jsonl"), 'w') as index:
+        for i, entry in enumerate(pool.imap(generate_job, jobs)):
+            index.write(json.dumps(entry) + "\n")
+            print(str(i + 1) + "/" + str(len(jobs)) + ": " + entry["file"] + " #vars=" + str(entry["n_vars"]) +
+                  " #clauses=" + str(entry["n_clauses"]) + " " + str(entry["time"]) + "s")
+    print("generated " + str(len(jobs)) + " instances in " + '{0:.2f}s'.format(time.time() - start) +
+          " using " + str(args.jobs) + " processes")
@@ -1,36 +1,40 @@
-import logging
-
 from SatFormula import *
 from SatClauses import SatClauses
 
-from itertools import chain, combinations
-
 
 class CNF:
-    def __init__(self, sat_memory, simplified_formula, expanded_variables=set()):
+    def __init__(self, sat_memory, simplified_formula, expanded_variables=set(), polarity_aware=False):
         """
 
         :param sat_memory:
         :param simplified_formula:
-        :param expanded_variables: mutable set!
+        :param expanded_variables: mutable set of expanded variable indices!
+            (in the polarity-aware mode: of expanded signed literal indices)
+        :param polarity_aware: if True, the Plaisted-Greenbaum encoding is used: for each expanded literal f, only
+            the clauses for f => expansion(f) are inserted, since each literal is required to be True only in
+            the polarity, in which it occurs (the expansions of -f are inserted only if -f occurs as well);
+            the set of solutions projected on the free variables remains the same, but the values of the other
+            variables are no longer determined uniquely
         """
         self.sat_memory = sat_memory
         self.simplified_formula = simplified_formula
         self.expanded_variables = expanded_variables
+        self.polarity_aware = polarity_aware
 
     def is_atom(self, literal, expanded_variables):
         if not literal.is_literal():
             return False
-        return self.sat_memory.is_free_var(literal.var_name) or (literal.var_name in expanded_variables)
+        if self.sat_memory.is_free_var(literal.index):
+            return True
+        return (int(literal) if self.polarity_aware else literal.index) in expanded_variables
 
     def expansion_for(self, literal):
-        s = str(literal)
-        inv = literal.inverse()
-        s_inv = str(inv)
+        s = int(literal)
+        s_inv = -s
         if (s not in self.sat_memory.reduced_formulas) and (s_inv not in self.sat_memory.reduced_formulas):
             raise Exception(
-                "Neither " + s + ", nor " + s_inv + " have an associated reduced formula. Furthermore, "
-                + literal.var_name + " is not a free variable.")
+                "Neither " + str(literal) + ", nor " + str(literal.inverse()) + " have an associated reduced formula. "
+                "Furthermore, " + literal.var_name + " is not a free variable.")
 
         if s in self.sat_memory.reduced_formulas:
             f = self.sat_memory.reduced_formulas[s]
@@ -39,172 +43,241 @@ class CNF:
             self.sat_memory.reduced_formulas[s] = f  # Or or And
         return f
 
-    def insert_dependencies(self, result, o, expanded_so_far):
-        if not self.is_atom(o, expanded_so_far):
-            expansion = self.expansion_for(o)
-            expanded_so_far.add(o.var_name)
-            if expansion.is_or():
-                for clause in self.sat_clauses_for_literal_equiv_or(o, expansion, expanded_so_far).as_list():
-                    result.insert(clause)
+    def expansion_step(self, f, expanded_so_far):
+        """Expands the literal f (which must not be an atom) and marks it as expanded.
+
+        :return: a stack frame [f, ff, dependencies, i], where ff is the expansion of f, dependencies are
+            the literals to be expanded before adding clauses for f <=> ff (f => ff in the polarity-aware mode),
+            and i is the index of the next dependency to consider
+        """
+        ff = self.expansion_for(f)
+        if self.polarity_aware:
+            expanded_so_far.add(int(f))
+            if ff.is_xor():
+                # f => ff depends on both polarities of the operands (unlike monotone And/Or/Majority)
+                dependencies = ff.operands + tuple(o.inverse() for o in ff.operands)
             else:
-                # print("EXPANSION: ",expansion)
-                if expansion.is_and():
-                    for clause in self.sat_clauses_for_literal_equiv_and(o, expansion, expanded_so_far).as_list():
-                        result.insert(clause)
+                dependencies = ff.operands
+            return [f, ff, dependencies, 0]
+
+        expanded_so_far.add(f.index)
+        if ff.is_or():
+            dependencies = ff.operands
+        elif ff.is_and():
+            # the clause ff => f is built from -ff (due to De Morgan's law, an OR formula)
+            dependencies = Not(self.sat_memory, ff).simplified_formula().operands
+        elif ff.is_gate():
+            dependencies = ff.operands
+        else:
+            dependencies = ()
+        return [f, ff, dependencies, 0]
 
-    def sat_clauses_for_and_formula(self, ff, expanded_so_far):
-        result = SatClauses()
+    def insert_dependencies(self, result, o, expanded_so_far):
+        """Inserts into result the clauses linking the literal o with its expansion, preceded by the clauses for
+        all the literals that expansion depends on (in the depth-first post-order).
+
+        The circuit is traversed with an explicit stack instead of recursion, since the circuit depth grows
+        with the width of the product and would exceed Python's recursion limit.
+        """
+        if self.is_atom(o, expanded_so_far):
+            return
+        stack = [self.expansion_step(o, expanded_so_far)]
+        while stack:
+            frame = stack[-1]
+            dependencies = frame[2]
+            i = frame[3]
+            while i < len(dependencies) and self.is_atom(dependencies[i], expanded_so_far):
+                i += 1
+            if i < len(dependencies):
+                frame[3] = i + 1
+                stack.append(self.expansion_step(dependencies[i], expanded_so_far))
+                continue
+            stack.pop()
+            f, ff = frame[0], frame[1]
+            if self.polarity_aware:
+                self.insert_literal_implies(result, f, ff)
+            elif ff.is_or():
+                self.insert_literal_equiv_or(result, f, ff)
+            elif ff.is_and():
+                self.insert_literal_equiv_and(result, f, ff, dependencies)
+            elif ff.is_xor():
+                self.insert_literal_equiv_xor(result, f, ff)
+            elif ff.is_majority():
+                self.insert_literal_equiv_majority(result, f, ff)
+
+    def insert_and_formula(self, result, ff, expanded_so_far):
         ff = ff.simplified_formula()
-        for o in ff.operands:
+        if ff.is_constant():
+            if ff.evaluation():
+                return  # empty CNF is True
+            else:
+                raise Exception("Unsatisfiable CNF " + str(ff))
+        for o in (ff.operands if ff.is_and() else [ff]):  # a single conjunct is simplified to itself
             assert o.is_literal()
             result.insert([int(o)])
             self.insert_dependencies(result, o, expanded_so_far)
 
-        return result
-
-    def sat_clauses_for_or_formula(self, ff, expanded_so_far, with_literal=None):
-        # the last clause in the returned list corresponds to the OR formula
-        current_clause = []
-        result = SatClauses()
+    def insert_or_formula(self, result, ff, expanded_so_far):
         for o in ff.operands:
             assert o.is_literal()
-            current_clause.append(int(o))
             self.insert_dependencies(result, o, expanded_so_far)
+        result.insert([int(o) for o in ff.operands])
 
-        if with_literal is not None:
-            current_clause.append(int(with_literal))
-        result.insert(current_clause)
-        return result
-
-    def sat_clauses_for_literal_equiv_and(self, f, ff, expanded_so_far):
-        """Returns CNF clauses for the formula f <=> ff
+    def insert_literal_equiv_and(self, result, f, ff, not_ff_operands):
+        """Inserts CNF clauses for the formula f <=> ff (the literals of ff are expanded separately)
 
+        :param result: SatClauses
         :param f: literal
         :param ff: and formula (is_and()==True)
-        :param expanded_so_far: a set of expanded literals so far
-        :return:
+        :param not_ff_operands: the operands of -ff (i.e., the negated operands of ff)
         """
 
         # ff => f === -ff | f
-        not_ff = Not(self.sat_memory, ff).simplified_formula()
-        result = self.sat_clauses_for_or_formula(not_ff, expanded_so_far, int(f))
-        # ^^^ result contains also clauses for resolving literals of the OR (because of De Morgan's law) formula -ff;
-        # the last argument extends the last clause (containing not_ff.operands[0] | not_ff.operands[1] | ...) with f
+        result.insert([int(o) for o in not_ff_operands] + [int(f)])
 
-        # f => ff === -f | +-ff.operands[0] | +-ff.operands[1] | ... except all -
+        # f => ff === (-f | ff.operands[0]) & (-f | ff.operands[1]) & ...
         assert not ff.is_literal()  # literals are not reduced by literals in SAT memory
+        v = int(f)
+        for o in ff.operands:
+            result.insert([-v, int(o)])
 
-        if len(ff.operands) == 2:
-            v = int(f)
-            a = int(ff.operands[0])
-            b = int(ff.operands[1])
-            result.insert([-v, -a, b])
-            result.insert([-v, a, -b])
-            result.insert([-v, a, b])
-            return result
-        else:
-            s = range(len(ff.operands))
-            if len(s) > 2:
-                logging.warning(
-                    "The formula " + str(ff) + " has more than two AND operands, which may lead to exponential "
-                                               "growth in clauses.")
-            subsets = chain.from_iterable(combinations(s, r) for r in range(1, len(s) + 1))
-            v = int(f)
-            for pos_literal_indices in subsets:
-                clause = [-v]
-                for i in s:
-                    if i in pos_literal_indices:
-                        clause.append(int(ff.operands[i]))
-                    else:
-                        clause.append(-int(ff.operands[i]))
-                result.insert(clause)
-            return result
-
-    def sat_clauses_for_literal_equiv_or(self, f, ff, expanded_so_far):
-        """Returns CNF clauses for the formula f <=> ff
+    def insert_literal_equiv_or(self, result, f, ff):
+        """Inserts CNF clauses for the formula f <=> ff (the literals of ff are expanded separately)
 
+        :param result: SatClauses
         :param f: literal
         :param ff: or formula (is_or()==True)
-        :param expanded_so_far: a set of expanded literals so far
-        :return:
         """
 
         # f => ff === -f | ff.operands[0] | ff.operands[1] | ...
-        # the last argument extends the last clause (containing ff.operands[0] | ff.operands[1] | ...) with -f
-        result = self.sat_clauses_for_or_formula(ff, expanded_so_far, int(f.inverse()))
-        # ^^^ result contains also clauses for resolving literals of the OR formula ff
+        result.insert([int(o) for o in ff.operands] + [-int(f)])
 
-        # ff => f === -ff | f === f | +-ff.operands[0] | +-ff.operands[1] | ... except all +
+        # ff => f === (f | -ff.operands[0]) & (f | -ff.operands[1]) & ...
         assert not ff.is_literal()  # literals are not reduced by literals in SAT memory
+        v = int(f)
+        for o in ff.operands:
+            result.insert([v, -int(o)])
 
-        if len(ff.operands) == 2:
-            v = int(f)
-            a = int(ff.operands[0])
-            b = int(ff.operands[1])
-            result.insert([v, -a, -b])
-            result.insert([v, -a, b])
-            result.insert([v, a, -b])
-            return result
-        else:
-            s = range(len(ff.operands))
-            if len(s) > 2:
-                logging.warning(
-                    "The formula " + str(ff) + " has more than two OR operands, which may lead to exponential "
-                                               "growth in clauses.")
-            subsets = chain.from_iterable(combinations(s, r) for r in range(1, len(s) + 1))
-            v = int(f)
-            for neg_literal_indices in subsets:
-                clause = [v]
-                for i in s:
-                    if i in neg_literal_indices:
-                        clause.append(-int(ff.operands[i]))
-                    else:
-                        clause.append(int(ff.operands[i]))
-                result.insert(clause)
-            return result
+    def insert_literal_equiv_xor(self, result, f, ff):
+        """Inserts CNF clauses for the formula f <=> ff (the literals of ff are expanded separately):
+        for each assignment of the k operands of ff, the clause excluding the wrong value of f (2^k clauses, k<=3)
+
+        :param result: SatClauses
+        :param f: literal
+        :param ff: XorGate
+        """
+        v = int(f)
+        operands = [int(o) for o in ff.operands]
+        for assignment in range(1 << len(operands)):
+            clause = []
+            parity = False
+            for i, o in enumerate(operands):
+                if (assignment >> i) & 1:  # the operand is True
+                    clause.append(-o)
+                    parity = not parity
+                else:
+                    clause.append(o)
+            clause.append(v if parity else -v)
+            result.insert(clause)
+
+    def insert_literal_equiv_majority(self, result, f, ff):
+        """Inserts CNF clauses for the formula f <=> ff (the literals of ff are expanded separately):
+        any two true operands imply f, any two false operands imply -f (6 clauses)
+
+        :param result: SatClauses
+        :param f: literal
+        :param ff: MajorityGate
+        """
+        v = int(f)
+        a, b, c = [int(o) for o in ff.operands]
+        for x, y in ((a, b), (a, c), (b, c)):
+            result.insert([-x, -y, v])
+            result.insert([x, y, -v])
+
+    def insert_literal_implies(self, result, f, ff):
+        """Inserts CNF clauses only for the formula f => ff (used in the polarity-aware mode)
+
+        :param result: SatClauses
+        :param f: literal
+        :param ff: the expansion of f (And, Or, XorGate, or MajorityGate)
+        """
+        v = int(f)
+        if ff.is_or():
+            result.insert([int(o) for o in ff.operands] + [-v])
+        elif ff.is_and():
+            for o in ff.operands:
+                result.insert([-v, int(o)])
+        elif ff.is_xor():
+            # only the clauses excluding f=True for the assignments of the operands with the even parity
+            operands = [int(o) for o in ff.operands]
+            for assignment in range(1 << len(operands)):
+                if bin(assignment).count("1") % 2 == 0:
+                    result.insert([-o if (assignment >> i) & 1 else o for i, o in enumerate(operands)] + [-v])
+        elif ff.is_majority():
+            # any two false operands imply -f
+            a, b, c = [int(o) for o in ff.operands]
+            for x, y in ((a, b), (a, c), (b, c)):
+                result.insert([x, y, -v])
 
     def clauses(self):
+        result = SatClauses()
+        self.insert_clauses(result)
+        return result.as_list()
+
+    def store_clauses(self, sink):
+        """Passes the clauses to sink.add_clause() (e.g., a DimacsWriter) as soon as they are produced.
+        Only the keys for detecting duplicate clauses are kept in memory.
+
+        :return: the number of clauses passed to sink
+        """
+        result = SatClauses(sink)
+        self.insert_clauses(result)
+        return len(result)
+
+    def insert_clauses(self, result):
         f = self.simplified_formula
         expanded_so_far = self.expanded_variables
 
+        if f.is_gate():
+            f = f.simplified_literal()
+
         if f.is_constant():
             print("Warning: the given literal " + str(f) + " is a constant")
             if f.evaluation():
-                return []  # empty CNF is True
+                return  # empty CNF is True
             else:
                 raise Exception("Unsatisfiable CNF " + str(f))
 
         if self.is_atom(f, expanded_so_far):
-            return [[int(f)]]
+            result.insert([int(f)])
+            return
 
         # not an atom - we have either a simplified and/or formula, or a literal that has to be expanded
 
         if f.is_and():
-            return self.sat_clauses_for_and_formula(f, expanded_so_far).as_list()
+            self.insert_and_formula(result, f, expanded_so_far)
+            return
 
         if f.is_or():
-            return self.sat_clauses_for_or_formula(f, expanded_so_far).as_list()
+            self.insert_or_formula(result, f, expanded_so_far)
+            return
 
         assert f.is_literal()
         # assert f not expanded
         assert not self.is_atom(f, expanded_so_far)
 
         ff = self.expansion_for(f)
-        expanded_so_far.add(f.var_name)
 
         # assert: ff is not a Not formula, since De Morgan's law would be applied;
         # ff is not a literal, since it is impossible to reduce a literal as another literal in SAT memory
-        assert ff.is_and() or ff.is_or()
+        assert ff.is_and() or ff.is_or() or ff.is_gate()
 
         # adding equivalence: f <=> ff (linking f with its expansion ff)
         if ff.is_and():
             print("adding AND EQUIV: " + str(f) + "===" + str(ff))
-            result = self.sat_clauses_for_literal_equiv_and(f, ff, expanded_so_far)
-            result.insert([int(f)])
-            return result.as_list()
-        else:  # ff.is_or()
+        elif ff.is_or():
             print("adding OR EQUIV: " + str(f) + "===" + str(ff))
-            result = SatClauses()
-            result = self.sat_clauses_for_literal_equiv_or(f, ff, expanded_so_far)
-            result.insert([int(f)])
-            return result.as_list()
+        else:
+            print("adding GATE EQUIV: " + str(f) + "===" + str(ff))
+        self.insert_dependencies(result, f, expanded_so_far)
+        result.insert([int(f)])
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import types
+
+from pysat.solvers import Solver
+
+from SatInteger import SatInteger
+from DimacsFile import DimacsFile
+from DimacsWriter import DimacsWriter
+from SatClauses import SatClauses
+from CnfSimplifier import CnfSimplifier
+from VariableRenumbering import VariableRenumbering
+from CircuitSimulator import CircuitSimulator
+from BitUtils import *
+from PrimesProductToSAT import generate
+from Solve import BATCH_SIZE, share_clauses, append_shared_clauses, parse_configurations, solve_portfolio
+
+# the options of generate() checked for each circuit (in addition to the circuit options)
+ENCODINGS = {
+    "default": {},
+    "polarity_aware": {"polarity_aware": True},
+    "simplify": {"simplify": True},
+    "keep_indices": {"renumber": False},
+    "sweep": {"sweep": True},
+    "aig": {"aig": True},
+    "template": {"template": True},
+}
+
+
+def report(name, problems):
+    """Prints the result of a focused check of a component.
+
+    :param problems: the descriptions of the failed checks
+    :return: the number of the failed checks
+    """
+    print(name, "OK" if len(problems) == 0 else "FAILED: " + "; ".join(problems))
+    return len(problems)
+
+
+def check_dimacs_writer(directory):
+    """Checks that DimacsWriter patches the header of a file read back by DimacsFile, and that it removes
+    the file when the clauses are not written completely."""
+    problems = []
+    filename = os.path.join(directory, "writer.cnf")
+    clauses = [[1, -2], [3], [-4, 5, 6]] + [[i, -i - 1] for i in range(1, DimacsWriter.BUFFER_SIZE)]
+    with DimacsWriter(filename, "a comment", n_vars=2) as writer:
+        writer.add_clauses(clauses)
+    with open(filename) as f:
+        lines = [f.readline().rstrip() for _ in range(2)]  # the header is padded by spaces
+    if lines != ["c a comment", "p cnf " + str(DimacsWriter.BUFFER_SIZE) + " " + str(len(clauses))]:
+        problems.append("the comment and header lines are " + str(lines))
+    df = DimacsFile(filename)
+    df.load()
+    if df.clauses() != clauses or df.number_of_vars() != DimacsWriter.BUFFER_SIZE:
+        problems.append("the clauses read back differ from the written ones")
+
+    try:
+        with DimacsWriter(filename) as writer:
+            writer.add_clause([1, 2])
+            raise Exception("interrupted")
+    except Exception:
+        pass
+    if os.path.exists(filename):
+        problems.append("the file written by an interrupted writer was not removed")
+    return report("DimacsWriter", problems)
+
+
+def check_sat_clauses():
+    """Checks the duplicate detection of SatClauses (also after its table grows), and that a DimacsFile sharing
+    the arrays of SatClauses does not add clauses behind its back."""
+    problems = []
+    clauses = SatClauses(sink=DimacsFile(None))
+    for c in [[1, 2], [2, 1], [1, 1, 2], [1, -1, 3], [], [-3]]:
+        clauses.insert(c)
+    if clauses.as_list() != [[1, 2], [-3]] or clauses.sink.clauses() != [[1, 2], [-3]]:
+        problems.append("the duplicate, tautological and empty clauses were not skipped: " +
+                        str(clauses.as_list()))
+
+    n = SatClauses.INITIAL_TABLE_SIZE  # enough to grow the table
+    for i in range(1, n + 1):
+        clauses.insert([-i, i + 1])
+    for i in range(n, 0, -1):
+        clauses.insert([i + 1, -i])
+    if len(clauses) != n + 2:
+        problems.append(str(len(clauses)) + " clauses stored instead of " + str(n + 2) + " after the table grew")
+
+    clauses = SatClauses()
+    clauses.insert([1, 2])
+    df = DimacsFile(None, clauses=clauses)
+    df.add_clause([4, 5])
+    clauses.insert([4, 5])
+    clauses.insert([4, 5])
+    if clauses.as_list() != [[1, 2], [4, 5]] or df.clauses() != [[1, 2], [4, 5]]:
+        problems.append("a DimacsFile sharing the arrays stored " + str(df.clauses()) + ", SatClauses stored " +
+                        str(clauses.as_list()))
+    return report("SatClauses", problems)
+
+
+def check_dimacs_loading(directory):
+    """Checks that DimacsFile.load() and iter_clauses() return the expected clauses for the clause sections
+    parsed in bulk and for the ones that fall back to the line-by-line parse."""
+    problems = []
+    filename = os.path.join(directory, "load.cnf")
+    files = {
+        "with the final newline": (b"c x\np cnf 5 3\n1 -2 0\n3 4 0\n-5 0\n", [[1, -2], [3, 4], [-5]], 5),
+        "without the final newline": (b"p cnf 5 3\n1 -2 0\n3 4 0\n-5 0", [[1, -2], [3, 4], [-5]], 5),
+        "with blank lines and an empty clause": (b"p cnf 4 3\n\n0\n1\t-4 0\n\n2 0\n\n", [[], [1, -4], [2]], 4),
+        "with a comment": (b"p cnf 3 2\n1 0\n-- a comment\n2 -3 0", [[1], [2, -3]], 3),
+        "with values": (b"p cnf 3 1\n1 2 0\nv 1 -2 3\n", [[1, 2]], 3),
+    }
+    for name, (data, clauses, n_vars) in files.items():
+        with open(filename, "wb") as f:
+            f.write(data)
+        df = DimacsFile(filename)
+        df.load()
+        streamed = [list(c) for c in DimacsFile(filename).iter_clauses()]
+        if df.clauses() != clauses or streamed != clauses or df.number_of_vars() != n_vars:
+            problems.append("the file " + name + " was loaded as " + str(df.clauses()) + " (" +
+                            str(df.number_of_vars()) + " variables)")
+    return report("DimacsFile.load", problems)
+
+
+def check_portfolio(solver_name):
+    """Checks that the portfolio of Solve.py passes all the shared clauses to each solver (in batches, and in
+    the shuffled order for a non-zero seed), reports correct results, and rejects invalid configurations."""
+    problems = []
+    n = 2 * BATCH_SIZE + 5
+    chain = [[-i, i + 1] for i in range(1, n)]  # x1 -> x2 -> ... -> xn
+    df = DimacsFile(None, clauses=chain + [[1]])
+    blocks, shared = share_clauses(df)
+    try:
+        for seed in (0, 7):
+            batches = []
+            solver = types.SimpleNamespace(append_formula=lambda batch: batches.append([list(c) for c in batch]))
+            append_shared_clauses(solver, shared, seed)
+            fed = sum(batches, [])
+            if max(map(len, batches)) > BATCH_SIZE or sorted(fed) != sorted(df.clauses()) or \
+                    (fed == df.clauses()) != (seed == 0):
+                problems.append("the clauses were passed in " + str(len(batches)) + " batches in a wrong order " +
+                                "for the seed " + str(seed))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    configurations = [solver_name, "glucose3:7"]
+    winner, is_sat, model = solve_portfolio(df, configurations)
+    if not is_sat or len(df.unsatisfied_clauses(model)) > 0:
+        problems.append(winner + " did not find a model of a satisfiable formula")
+    winner, is_sat, model = solve_portfolio(DimacsFile(None, clauses=chain + [[1], [-n]]), configurations)
+    if is_sat:
+        problems.append(winner + " found a model of an unsatisfiable formula")
+    for configurations in (["no_such_solver"], ["glucose3", "glucose3:0"], ["glucose3:x"]):
+        try:
+            parse_configurations(configurations)
+            problems.append("the configurations " + " ".join(configurations) + " were accepted")
+        except Exception:
+            pass
+    return report("Solve portfolio", problems)
+
+
+def random_clauses(rng, n_vars, n_clauses):
+    # binary clauses (which form equivalences for the simplifier) and ternary ones over x1..x(n_vars)
+    return [[rng.choice((-1, 1)) * v for v in rng.sample(range(1, n_vars + 1), rng.choice((2, 2, 3)))]
+            for _ in range(n_clauses)]
+
+
+def check_simplifier(solver_name, n_formulas=200, n_models=8):
+    """Checks on random formulas that CnfSimplifier preserves the satisfiability, and that extend_model() maps
+    the models of the simplified CNF to models of the original one, which agree on the frozen variables."""
+    problems = []
+    rng = random.Random(0)
+    n_reconstructed = {"equiv": 0, "elim": 0}
+    for k in range(n_formulas):
+        clauses = random_clauses(rng, 12, 24)
+        frozen = range(1, 4)
+        original = DimacsFile(None, clauses=clauses)
+        simplifier = CnfSimplifier(clauses, frozen)
+        with contextlib.redirect_stdout(io.StringIO()):  # simplify() prints the sizes
+            simplifier.simplify()
+        for entry in simplifier.stack:
+            n_reconstructed[entry[0]] += 1
+        with Solver(name=solver_name, bootstrap_with=clauses) as solver:
+            is_sat = solver.solve()
+        with Solver(name=solver_name, bootstrap_with=simplifier.clauses()) as solver:
+            if solver.solve() != is_sat:
+                problems.append("formula " + str(k) + ": the satisfiability changed")
+                continue
+            for _ in range(n_models if is_sat else 0):
+                model = solver.get_model()
+                extended = simplifier.extend_model(model)
+                if len(original.unsatisfied_clauses(extended)) > 0 or \
+                        any((model[v - 1] > 0) != (extended[v - 1] > 0) for v in frozen if v <= len(model)):
+                    problems.append("formula " + str(k) + ": the model " + str(model) + " was extended to " +
+                                    str(extended) + ", which is not a model of the original formula")
+                    break
+                solver.add_clause([-i for i in model])  # the next model of the simplified CNF
+                if not solver.solve():
+                    break
+    if min(n_reconstructed.values()) == 0:
+        problems.append("the formulas did not exercise the reconstruction: " + str(n_reconstructed))
+    return report("CnfSimplifier.extend_model", problems)
+
+
+def check_renumbering(solver_name, n_formulas=50):
+    """Checks on random formulas with sparse variable indices that VariableRenumbering numbers the variables
+    densely (keeping the fixed ones), and that original_model() maps the models of the renumbered clauses
+    to models of the original ones."""
+    problems = []
+    rng = random.Random(0)
+    n_fixed = 3
+    for k in range(n_formulas):
+        sparse = {v: v if v <= n_fixed else 1000 - 37 * v for v in range(1, 13)}
+        clauses = [[sparse[abs(i)] if i > 0 else -sparse[abs(i)] for i in c] for c in random_clauses(rng, 12, 20)]
+        renumbered = DimacsFile(None)
+        renumbering = VariableRenumbering(renumbered, n_fixed)
+        renumbering.add_clauses(clauses)
+        n_vars = len(set(abs(i) for c in clauses for i in c if abs(i) > n_fixed)) + n_fixed
+        if renumbering.number_of_vars() != n_vars or renumbered.number_of_vars() > n_vars:
+            problems.append("formula " + str(k) + ": " + str(renumbered.number_of_vars()) + " variables after the "
+                            "renumbering instead of " + str(n_vars))
+        with Solver(name=solver_name, bootstrap_with=renumbered.clauses()) as solver:
+            if solver.solve():
+                model = set(renumbering.original_model(solver.get_model()))
+                if not all(any(i in model for i in c) for c in clauses):
+                    problems.append("formula " + str(k) + ": the model " + str(sorted(model, key=abs)) +
+                                    " does not satisfy the original formula")
+    return report("VariableRenumbering.original_model", problems)
+
+
+def factor_solutions(filename, p_bits, q_bits, solver_name, max_solutions=2):
+    """Returns up to max_solutions different (p, q) values of the factor variables x1..x(p_bits+q_bits)
+    in the models of the given DIMACS file."""
+    df = DimacsFile(filename)
+    df.load()
+    solutions = []
+    with Solver(name=solver_name, bootstrap_with=df.iter_stored_clauses()) as solver:
+        while len(solutions) < max_solutions and solver.solve():
+            model = solver.get_model()
+            bits = [model[i] > 0 for i in range(p_bits + q_bits)]
+            solutions.append((sum(1 << i for i in range(p_bits) if bits[i]),
+                              sum(1 << i for i in range(q_bits) if bits[p_bits + i])))
+            # excluding this assignment of the factor variables
+            solver.add_clause([-(i + 1) if bits[i] else i + 1 for i in range(p_bits + q_bits)])
+    return solutions
+
+
+def check_factorizations(p, q, toom3_bits, solver_name, encodings):
+    """Generates the instance for factoring p*q for every combination of the circuit options and the encodings
+    and checks that (p, q) is its only solution.
+
+    :return: the number of the failed variants
+    """
+    p, q = max(p, q), min(p, q)
+    n = p * q
+    p_bits, q_bits = bits_required(p), bits_required(q)
+    n_failed = 0
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, str(n) + ".cnf")
+        for multiplier in SatInteger.MULTIPLIERS:
+            for base_multiplier in SatInteger.BASE_MULTIPLIERS:
+                for adder in SatInteger.ADDERS:
+                    for encoding in encodings:
+                        options = dict(ENCODINGS[encoding])
+                        if options.pop("template", False):
+                            options["template_dir"] = os.path.join(directory, "templates")
+                        t = time.time()
+                        with contextlib.redirect_stdout(io.StringIO()):  # generate() prints the bits of n
+                            n_vars, n_clauses = generate(filename, n, p_bits, q_bits, adder=adder,
+                                                         multiplier=multiplier, toom3_bits=toom3_bits,
+                                                         base_multiplier=base_multiplier, **options)
+                        solutions = factor_solutions(filename, p_bits, q_bits, solver_name)
+                        ok = solutions == [(p, q)]
+                        print(str(n) + " = " + str(p) + " x " + str(q), multiplier, base_multiplier, adder, encoding,
+                              "#vars", n_vars, "#clauses", n_clauses,
+                              "OK" if ok else "FAILED: solutions " + str(solutions), "%.2fs" % (time.time() - t))
+                        if not ok:
+                            n_failed += 1
+    return n_failed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Checks that the generated factoring instances have the unique "
+                                                 "correct solution for every circuit and encoding option, and "
+                                                 "validates the multiplier circuits by simulation (see "
+                                                 "CircuitSimulator.py).")
+    parser.add_argument("--factors", type=int, nargs=2, default=[509, 503], metavar=("P", "Q"),
+                        help="two distinct primes (default: 509 503)")
+    parser.add_argument("--toom3-bits", type=int, default=8,
+                        help="the Toom-3 threshold for the toom3 variants (default: 8, to exercise Toom-3 on "
+                             "short factors)")
+    parser.add_argument("--encodings", nargs="+", choices=list(ENCODINGS), default=list(ENCODINGS),
+                        help="the encoding options to check (default: all)")
+    parser.add_argument("--solver", default="cadical153")
+    parser.add_argument("--widths", nargs="*", default=["8", "16", "13:7", "24:20"],
+                        help="the widths of the simulated factors (n for n x n bits, or n:m for n x m bits; "
+                             "default: 8 16 13:7 24:20)")
+    parser.add_argument("--samples", type=int, default=256,
+                        help="the number of simulated factor pairs, at least 4 (default: 256)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        n_failed = check_dimacs_writer(directory)
+        n_failed += check_dimacs_loading(directory)
+    n_failed += check_sat_clauses()
+    n_failed += check_portfolio(args.solver)
+    n_failed += check_simplifier(args.solver)
+    n_failed += check_renumbering(args.solver)
+    n_failed += check_factorizations(args.factors[0], args.factors[1], args.toom3_bits, args.solver, args.encodings)
+    n_failed += CircuitSimulator.check_variants(args.widths, args.samples, 0, SatInteger.SCHOOLBOOK_BITS,
+                                                args.toom3_bits)
+    if n_failed > 0:
+        print(str(n_failed) + " variants FAILED")
+        exit(1)
+    print("all variants OK")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import time
+
+from SatInteger import SatInteger
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CircuitSimulator:
+    """Evaluates the circuit built in a SatMemory for many assignments of the free variables at once.
+
+    Unlike SatFormula.evaluation(), which walks the formulas once per assignment and caches the values in
+    sat_memory.values, the circuit is compiled once into a levelized list of gates (each gate after its operands),
+    and each gate is evaluated by a single bitwise operation on words, in which bit j corresponds to the j-th
+    assignment. The words are Python integers (of any width) or, for more than 64 assignments, if numpy is
+    available, arrays of uint64.
+    """
+
+    AND, OR, XOR, MAJ = range(4)
+
+    def __init__(self, sat_memory, outputs):
+        """
+
+        :param sat_memory: the SatMemory, in which the circuit has been built
+        :param outputs: the formulas (usually, literals) to be computed, e.g., the literals of a SatInteger
+        """
+        self.sat_memory = sat_memory
+        self.slots = {}  # formula key -> the index of the word holding the value of the formula
+        self.n_slots = 1  # slot 0 holds the constant False
+        self.inputs = {}  # variable index -> slot, for the variables not representing any formula
+        self.slot_keys = [None]  # slot -> formula key
+        self.levels = [0]  # slot -> the length of the longest path from the inputs
+        gates = []  # (slot, operator, ((operand slot, operand inverted), ...), output inverted)
+        self.outputs = []
+        for f in outputs:
+            node = self.node(f)
+            if node is not None:
+                self.compile(node, gates)
+            self.outputs.append(self.operand(f))
+        gates.sort(key=lambda gate: self.levels[gate[0]])  # a stable sort keeps each level in topological order
+        self.gates = gates
+        self.depth = max(self.levels)
+
+    def node(self, f):
+        """Returns the node computing f up to the negation (the positive literal for a literal,
+        f itself for a compound formula), or None for a constant."""
+        if f.is_constant():
+            return None
+        if f.is_literal():
+            return self.sat_memory.literals[f.index]
+        return f
+
+    def operand(self, f):
+        # (slot, inverted) for a compiled formula
+        if f.is_constant():
+            return 0, f.value
+        if f.is_literal():
+            return self.slots[f.index], f.is_negation()
+        return self.slots[f.key()], False
+
+    def definition(self, node):
+        """Returns (formula, inverted), where the value of the node is the value of the formula (if not inverted) or
+        its negation (if inverted); returns (None, False) for the free variables."""
+        if not node.is_literal():
+            return node, False
+        reduced_formulas = self.sat_memory.reduced_formulas
+        if node.index in reduced_formulas:
+            return reduced_formulas[node.index], False
+        if -node.index in reduced_formulas:
+            return reduced_formulas[-node.index], True
+        return None, False
+
+    def compile(self, root, gates):
+        # post-order traversal with an explicit stack, since the circuits are deep (e.g., ripple-carry chains)
+        work = [root]
+        while len(work) > 0:
+            node = work[-1]
+            key = node.key()
+            if key in self.slots:
+                work.pop()
+                continue
+            formula, inverted = self.definition(node)
+            if formula is None:
+                self.inputs[node.index] = self.new_slot(key, 0)
+                work.pop()
+                continue
+            pending = [child for child in map(self.node, formula.operands)
+                       if child is not None and child.key() not in self.slots]
+            if len(pending) > 0:
+                work.extend(pending)
+                continue
+            work.pop()
+
+            if formula.is_negation():  # Not(o) = And(-o)
+                operator = CircuitSimulator.AND
+                inverted = not inverted
+            elif formula.is_and():
+                operator = CircuitSimulator.AND
+            elif formula.is_or():
+                operator = CircuitSimulator.OR
+            elif formula.is_xor():
+                operator = CircuitSimulator.XOR
+            elif formula.is_majority():
+                operator = CircuitSimulator.MAJ
+            else:
+                raise Exception("unknown formula: " + str(formula))
+            operands = tuple(self.operand(o) for o in formula.operands)
+            level = 1 + max((self.levels[slot] for slot, _ in operands), default=0)
+            gates.append((self.new_slot(key, level), operator, operands, inverted))
+
+    def new_slot(self, key, level):
+        slot = self.n_slots
+        self.n_slots += 1
+        self.slots[key] = slot
+        self.slot_keys.append(key)
+        self.levels.append(level)
+        return slot
+
+    def number_of_gates(self):
+        return len(self.gates)
+
+    def simulate(self, inputs, width=64):
+        """Evaluates the outputs for width assignments at once.
+
+        :param inputs: variable index -> a width-bit integer, the bit j of which is the value of the variable
+            in the j-th assignment (the variables not given are False)
+        :param width: the number of assignments
+        :return: the list of width-bit integers, one for each output
+        """
+        values, ones = self.evaluate(inputs, width)
+        return [CircuitSimulator.as_int(values[slot] ^ ones if inv else values[slot]) for slot, inv in self.outputs]
+
+    def evaluate(self, inputs, width):
+        """Evaluates all the gates (see simulate()).
+
+        :return: (slot -> word, the word of all ones); the words can be converted to integers by as_int()
+        """
+        mask = (1 << width) - 1
+        use_numpy = numpy is not None and width > 64
+        if use_numpy:
+            n_words = (width + 63) // 64
+            zero = numpy.zeros(n_words, dtype=numpy.uint64)
+            ones = numpy.full(n_words, 0xFFFFFFFFFFFFFFFF, dtype=numpy.uint64)
+            ones[-1] >>= numpy.uint64(n_words * 64 - width)  # the unused bits of the last word are kept zero
+        else:
+            zero = 0
+            ones = mask
+
+        values = [zero] * self.n_slots
+        for v, slot in self.inputs.items():
+            word = inputs.get(v, 0) & mask
+            if use_numpy:
+                word = numpy.frombuffer(word.to_bytes(n_words * 8, "little"), dtype="<u8").astype(numpy.uint64)
+            values[slot] = word
+
+        AND, OR, XOR = CircuitSimulator.AND, CircuitSimulator.OR, CircuitSimulator.XOR
+        for slot, operator, operands, inverted in self.gates:
+            words = [values[s] ^ ones if inv else values[s] for s, inv in operands]
+            if operator == AND:
+                result = words[0]
+                for w in words[1:]:
+                    result = result & w
+            elif operator == OR:
+                result = words[0]
+                for w in words[1:]:
+                    result = result | w
+            elif operator == XOR:
+                result = words[0]
+                for w in words[1:]:
+                    result = result ^ w
+            else:
+                a, b, c = words
+                result = (a & b) | (c & (a | b))
+            values[slot] = result ^ ones if inverted else result
+        return values, ones
+
+    @staticmethod
+    def as_int(word):
+        if isinstance(word, int):
+            return word
+        return int.from_bytes(word.astype("<u8").tobytes(), "little")
+
+    @staticmethod
+    def transposed(numbers, n_bits):
+        """Converts the list of numbers to the list of n_bits words, where the bit j of the i-th word is
+        the bit i of the j-th number (or back, for transposed(words, len(numbers)))."""
+        words = []
+        for i in range(n_bits):
+            w = 0
+            for j, x in enumerate(numbers):
+                w |= ((x >> i) & 1) << j
+            words.append(w)
+        return words
+
+    def simulate_integers(self, assignments, width):
+        """Evaluates the outputs (the bits of an integer, the least significant first) for width assignments
+        to SatIntegers of free variables.
+
+        :param assignments: a list of (SatInteger, the list of width values)
+        :return: the list of width output values
+        """
+        inputs = {}
+        for integer, numbers in assignments:
+            for lit, w in zip(integer.literals, CircuitSimulator.transposed(numbers, integer.n_bits)):
+                inputs[lit.index] = w if not lit.is_negation() else w ^ ((1 << width) - 1)
+        return CircuitSimulator.transposed(self.simulate(inputs, width), width)
+
+    @staticmethod
+    def simulate_product(p_bits, q_bits, n_samples=64, seed=None, **options):
+        """Builds the product circuit of PrimesProductToSAT (with the given options of build_circuit()) and
+        simulates it on random factors (and the extreme values 0, 1, and 2^bits-1).
+
+        :param n_samples: the number of factor pairs (at least 4): the pairs (0, 0), (max, max), (max, 1),
+            (1, max) followed by random ones
+        :return: (simulator, the list of (x, y, the simulated product, the simulated value of the conjuncts))
+        """
+        if n_samples < 4:
+            raise Exception("at least 4 samples are required to include the extreme factors, got " + str(n_samples))
+        from PrimesProductToSAT import build_circuit  # not at the top, since PrimesProductToSAT uses SatSweeper
+        mem, p, q, pq, conjuncts = build_circuit(p_bits, q_bits, **options)
+        rng = random.Random(seed)
+        p_max, q_max = (1 << p_bits) - 1, (1 << q_bits) - 1
+        xs = [0, p_max, p_max, 1] + [rng.getrandbits(p_bits) for _ in range(n_samples - 4)]
+        ys = [0, q_max, 1, q_max] + [rng.getrandbits(q_bits) for _ in range(n_samples - 4)]
+
+        simulator = CircuitSimulator(mem, pq.literals + conjuncts)
+        words = simulator.simulate_integers([(p, xs), (q, ys)], n_samples)
+        n_conjuncts = len(conjuncts)
+        samples = []
+        for x, y, w in zip(xs, ys, words):
+            samples.append((x, y, w & ((1 << pq.n_bits) - 1), (w >> pq.n_bits) == (1 << n_conjuncts) - 1))
+        return simulator, samples
+
+    @staticmethod
+    def check_product(p_bits, q_bits, n_samples=64, seed=None, **options):
+        """Compares the simulated products (and the constraints on the factors) with Python integer arithmetic.
+
+        :return: (simulator, the list of the mismatching samples (x, y, the simulated product))
+        """
+        simulator, samples = CircuitSimulator.simulate_product(p_bits, q_bits, n_samples, seed, **options)
+        mismatches = []
+        for x, y, product, accepted in samples:
+            y_clipped = y & ((1 << p_bits) - 1)
+            if product != x * y or accepted != (x > 1 and y > 1 and x >= y_clipped):
+                mismatches.append((x, y, product))
+        return simulator, mismatches
+
+    @staticmethod
+    def check_variants(widths, n_samples, seed, schoolbook_bits, toom3_bits):
+        """Runs check_product() for every combination of the multiplier, the base multiplier, and the adder.
+
+        :param widths: the widths of the factors ("n" for n x n bits, or "n:m" for n x m bits)
+        :return: the number of the failed variants
+        """
+        n_failed = 0
+        for arg in widths:
+            p_bits, q_bits = (int(arg), int(arg)) if ":" not in arg else map(int, arg.split(":"))
+            for multiplier in SatInteger.MULTIPLIERS:
+                for base_multiplier in SatInteger.BASE_MULTIPLIERS:
+                    for adder in SatInteger.ADDERS:
+                        t = time.time()
+                        simulator, mismatches = CircuitSimulator.check_product(
+                            p_bits, q_bits, n_samples, seed, adder=adder, schoolbook_bits=schoolbook_bits,
+                            multiplier=multiplier, toom3_bits=toom3_bits, base_multiplier=base_multiplier)
+                        print(str(p_bits) + "x" + str(q_bits), multiplier, base_multiplier, adder,
+                              "#gates", simulator.number_of_gates(), "depth", simulator.depth,
+                              "OK" if len(mismatches) == 0 else "FAILED " + str(mismatches[:3]),
+                              "%.2fs" % (time.time() - t))
+                        if len(mismatches) > 0:
+                            n_failed += 1
+        return n_failed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Validates the multiplier circuits by bit-parallel simulation "
+                                                 "against Python integer multiplication.")
+    parser.add_argument("bits", nargs="+",
+                        help="the widths of the factors (n for n x n bits, or n:m for n x m bits)")
+    parser.add_argument("--samples", type=int, default=1024,
+                        help="the number of factor pairs, at least 4 (default: 1024)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--schoolbook-bits", type=int, default=SatInteger.SCHOOLBOOK_BITS)
+    parser.add_argument("--toom3-bits", type=int, default=16,
+                        help="the Toom-3 threshold for the toom3 variants (default: 16, lower than in "
+                             "PrimesProductToSAT.py to exercise Toom-3 on shorter factors)")
+    args = parser.parse_args()
+
+    n_failed = CircuitSimulator.check_variants(args.bits, args.samples, args.seed, args.schoolbook_bits,
+                                               args.toom3_bits)
+    if n_failed > 0:
+        print(str(n_failed) + " variants FAILED")
+        exit(1)
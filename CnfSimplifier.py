@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+
+class CnfSimplifier:
+    """Simplifies a CNF while preserving the names of the variables (unlike external preprocessors, which renumber
+    them): the remaining clauses use the original variable indices, and the frozen variables (e.g., the bits of
+    the factors) are never eliminated or substituted. Thus, the values of the frozen variables can be read from
+    the model of the simplified CNF directly, while extend_model() reconstructs the values of the other variables.
+
+    The simplifications (repeated until nothing changes):
+      - unit propagation (e.g., from the unit clauses for the product bits);
+      - equivalent literal substitution: the strongly connected components of the binary implication graph
+        are found, and each variable is replaced by the representative of its component (a frozen variable,
+        if any, or the variable with the smallest index);
+      - subsumption: the clauses containing another clause are removed;
+      - bounded variable elimination: a variable is replaced by all the non-tautological resolvents of the
+        clauses containing it, if there are no more of them than of those clauses.
+
+    The reconstruction stack contains ("equiv", v, lit), if v was replaced by lit, and ("elim", v, clauses),
+    if v was eliminated (clauses are the removed clauses containing the positive literal v).
+    """
+
+    MAX_OCCURRENCES = 16  # the variables occurring in more clauses are not eliminated
+    MAX_RESOLVENT_LENGTH = 16  # the variables with longer resolvents are not eliminated
+    MAX_ROUNDS = 10
+
+    def __init__(self, clauses, frozen=()):
+        """
+
+        :param clauses: an iterable of clauses (iterables of non-zero integers)
+        :param frozen: the indices of the variables to be kept
+        """
+        self.frozen = set(abs(i) for i in frozen)
+        self.clause_list = []  # clause index -> sorted tuple of literals, or None for removed clauses
+        self.occurrences = {}  # literal -> the set of indices of the clauses containing it
+        self.keys = {}  # clause tuple -> clause index (for detecting duplicates)
+        self.values = {}  # variable index -> the value of the variable fixed by unit propagation
+        self.units = []  # the literals to be propagated
+        self.stack = []  # the reconstruction stack
+        self.unsatisfiable = False
+        self.n_vars = max(self.frozen, default=0)
+        for c in clauses:
+            self.add(c)
+        self.n_vars_before = len([v for v in range(1, self.n_vars + 1) if self.occurs(v)])
+        self.n_clauses_before = len(self.keys)
+
+    def add(self, clause):
+        literal_set = set(map(int, clause))
+        for x in literal_set:
+            if -x in literal_set:
+                return  # the clause is always True
+            if abs(x) > self.n_vars:
+                self.n_vars = abs(x)
+        if len(literal_set) == 0:
+            self.unsatisfiable = True
+            return
+        c = tuple(sorted(literal_set))
+        if c in self.keys:
+            return  # a duplicate clause
+        j = len(self.clause_list)
+        self.clause_list.append(c)
+        self.keys[c] = j
+        for x in c:
+            self.occurrences.setdefault(x, set()).add(j)
+        if len(c) == 1:
+            self.units.append(c[0])
+
+    def remove(self, j):
+        c = self.clause_list[j]
+        for x in c:
+            self.occurrences[x].discard(j)
+        del self.keys[c]
+        self.clause_list[j] = None
+
+    def occurs(self, v):
+        return len(self.occurrences.get(v, ())) + len(self.occurrences.get(-v, ())) > 0
+
+    def assign(self, lit):
+        v = abs(lit)
+        if v in self.values:
+            if self.values[v] != (lit > 0):
+                self.unsatisfiable = True
+            return
+        self.values[v] = lit > 0
+        for j in list(self.occurrences.get(lit, ())):
+            self.remove(j)  # satisfied
+        for j in list(self.occurrences.get(-lit, ())):
+            c = self.clause_list[j]
+            self.remove(j)
+            self.add([x for x in c if x != -lit])
+
+    def propagate(self):
+        while len(self.units) > 0 and not self.unsatisfiable:
+            self.assign(self.units.pop())
+
+    def substitute_equivalences(self):
+        """Replaces the equivalent literals by their representatives; returns the number of replaced variables."""
+        # the binary implication graph: the clause (a b) gives the edges -a -> b and -b -> a
+        successors = {}
+        for c in self.clause_list:
+            if c is not None and len(c) == 2:
+                a, b = c
+                successors.setdefault(-a, []).append(b)
+                successors.setdefault(-b, []).append(a)
+
+        # Tarjan's algorithm (with an explicit stack)
+        index = {}
+        low = {}
+        on_stack = set()
+        component_stack = []
+        components = []
+        for root in successors:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            component_stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(successors.get(root, ())))]
+            while len(work) > 0:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        component_stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(successors.get(child, ()))))
+                    elif child in on_stack:
+                        low[node] = min(low[node], index[child])
+                    continue
+                work.pop()
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        x = component_stack.pop()
+                        on_stack.discard(x)
+                        component.append(x)
+                        if x == node:
+                            break
+                    if len(component) > 1:
+                        components.append(component)
+
+        replacements = {}  # variable -> the literal replacing it
+        for component in components:
+            literal_set = set(component)
+            if any(-x in literal_set for x in literal_set):
+                self.unsatisfiable = True
+                return 0
+            representative = min(component, key=lambda x: (abs(x) not in self.frozen, abs(x)))
+            for x in component:
+                v = abs(x)
+                # the frozen variables are kept (together with the binary clauses linking them)
+                if x != representative and v not in self.frozen and v not in replacements:
+                    replacements[v] = representative if x > 0 else -representative
+
+        affected = set()
+        for v in replacements:
+            affected.update(self.occurrences.get(v, ()))
+            affected.update(self.occurrences.get(-v, ()))
+            self.stack.append(("equiv", v, replacements[v]))
+        for j in affected:
+            c = self.clause_list[j]
+            self.remove(j)
+            self.add([(replacements[abs(x)] if x > 0 else -replacements[abs(x)]) if abs(x) in replacements else x
+                      for x in c])
+        self.propagate()
+        return len(replacements)
+
+    def subsume(self):
+        """Removes the subsumed clauses; returns their number."""
+        n_removed = 0
+        order = sorted((j for j, c in enumerate(self.clause_list) if c is not None),
+                       key=lambda j: len(self.clause_list[j]))
+        for j in order:
+            c = self.clause_list[j]
+            if c is None:
+                continue
+            # the clauses containing c must contain its least frequent literal
+            x = min(c, key=lambda y: len(self.occurrences[y]))
+            for k in list(self.occurrences[x]):
+                d = self.clause_list[k]
+                if k != j and len(d) >= len(c) and set(c).issubset(d):
+                    self.remove(k)
+                    n_removed += 1
+        return n_removed
+
+    def eliminate_variables(self):
+        """Performs bounded variable elimination; returns the number of eliminated variables."""
+        n_eliminated = 0
+        candidates = [v for v in range(1, self.n_vars + 1)
+                      if v not in self.frozen and v not in self.values and self.occurs(v)]
+        candidates.sort(key=lambda v: len(self.occurrences.get(v, ())) * len(self.occurrences.get(-v, ())))
+        for v in candidates:
+            if self.unsatisfiable:
+                break
+            positive = [self.clause_list[j] for j in self.occurrences.get(v, ())]
+            negative = [self.clause_list[j] for j in self.occurrences.get(-v, ())]
+            n_clauses = len(positive) + len(negative)
+            if n_clauses == 0 or n_clauses > CnfSimplifier.MAX_OCCURRENCES:
+                continue
+            resolvents = []
+            for c in positive:
+                for d in negative:
+                    r = set(c) | set(d)
+                    r.discard(v)
+                    r.discard(-v)
+                    if any(-x in r for x in r):
+                        continue  # a tautology
+                    if len(r) > CnfSimplifier.MAX_RESOLVENT_LENGTH or len(resolvents) == n_clauses:
+                        resolvents = None
+                        break
+                    resolvents.append(r)
+                if resolvents is None:
+                    break
+            if resolvents is None:
+                continue
+            self.stack.append(("elim", v, positive))
+            for j in list(self.occurrences.get(v, ())) + list(self.occurrences.get(-v, ())):
+                self.remove(j)
+            for r in resolvents:
+                self.add(r)
+            self.propagate()
+            n_eliminated += 1
+        return n_eliminated
+
+    def simplify(self):
+        self.propagate()
+        for i in range(CnfSimplifier.MAX_ROUNDS):
+            if self.unsatisfiable:
+                break
+            n_changes = self.substitute_equivalences()
+            n_changes += self.subsume()
+            n_changes += self.eliminate_variables()
+            if n_changes == 0:
+                break
+        print("simplified: #vars " + str(self.n_vars_before) + " -> " + str(self.number_of_vars()) +
+              ", #clauses " + str(self.n_clauses_before) + " -> " + str(self.number_of_clauses()) +
+              (" (UNSAT)" if self.unsatisfiable else ""))
+
+    def number_of_vars(self):
+        # the number of the variables occurring in the simplified clauses
+        return len([v for v in range(1, self.n_vars + 1) if self.occurs(v) or (v in self.frozen and v in self.values)])
+
+    def number_of_clauses(self):
+        return len(self.clauses())
+
+    def clauses(self):
+        """Returns the simplified clauses, including the unit clauses for the fixed frozen variables (if the CNF is
+        unsatisfiable, a contradicting pair of unit clauses is returned)."""
+        if self.unsatisfiable:
+            v = min(self.frozen, default=1)
+            return [[v], [-v]]
+        result = [[v if self.values[v] else -v] for v in sorted(self.frozen) if v in self.values]
+        result += [list(c) for c in self.clause_list if c is not None]
+        return result
+
+    def store_clauses(self, sink):
+        """Passes the simplified clauses to sink.add_clause() (e.g., a DimacsWriter).
+
+        :return: the number of clauses passed to sink
+        """
+        clauses = self.clauses()
+        for c in clauses:
+            sink.add_clause(c)
+        return len(clauses)
+
+    def extend_model(self, model):
+        """Maps a model of the simplified CNF to a model of the original one.
+
+        :param model: a list of non-zero literals, e.g., returned by pysat's get_model()
+        :return: the list of literals for the variables 1..n_vars of the original CNF
+        """
+        values = {abs(i): i > 0 for i in model}
+        values.update(self.values)  # the solver may assign any values to the variables not occurring in the CNF
+        for entry in reversed(self.stack):
+            if entry[0] == "equiv":
+                v, lit = entry[1], entry[2]
+                values[v] = values.get(abs(lit), False) == (lit > 0)
+            else:
+                # v is True iff some clause containing v is not satisfied by the other literals
+                v, clauses = entry[1], entry[2]
+                values[v] = any(not any(x != v and values.get(abs(x), False) == (x > 0) for x in c) for c in clauses)
+        return [v if values.get(v, False) else -v for v in range(1, self.n_vars + 1)]
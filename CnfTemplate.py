@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from array import array
+
+from CNF import CNF
+from SatClauses import SatClauses
+from VariableRenumbering import VariableRenumbering
+
+
+class CnfTemplate:
+    """The CNF of a circuit, the outputs of which are fixed later by unit clauses (or solver assumptions).
+
+    For factoring, the circuit (the product of two factors of the given widths together with the constraints
+    on the factors) does not depend on n: only the unit clauses for the product bits do. Thus, the template
+    is built once per widths/options, persisted on disk, and instantiated for each n by appending unit clauses.
+
+    The template file consists of the MAGIC line, one JSON header line, and the raw literals (int32) and
+    offsets (int64) arrays (see SatClauses).
+    """
+
+    MAGIC = b"CNF-TEMPLATE 1\n"
+
+    def __init__(self, n_vars, literals, offsets, outputs, comments=()):
+        """
+
+        :param n_vars:
+        :param literals: the flat array of the literals of all clauses
+        :param offsets: offsets[i]:offsets[i+1] is the slice of the i-th clause in literals
+        :param outputs: the output bits (right-to-left): signed literal indices, or "True"/"False" for constants
+        :param comments: DIMACS comments shared by all the instances
+        """
+        self.n_vars = n_vars
+        self.literals = literals
+        self.offsets = offsets
+        self.outputs = list(outputs)
+        self.comments = list(comments)
+        self.body = None  # the DIMACS clause lines (computed on the first instantiation)
+
+    @staticmethod
+    def build(sat_memory, formula, outputs, *comments, polarity_aware=False, n_fixed=None):
+        """Builds the template for the given formula (the constraints not depending on the outputs)
+        and the clauses linking the given output literals with their expansions.
+
+        :param sat_memory:
+        :param formula: a formula that must be True in all the instances
+        :param outputs: Literal or Constant instances (right-to-left)
+        :param comments:
+        :param polarity_aware: see CNF; the outputs are expanded in both polarities, since each of them
+            may be fixed either way
+        :param n_fixed: if set, the variables are renumbered densely, except 1..n_fixed (see VariableRenumbering)
+        """
+        result = SatClauses()
+        cnf = CNF(sat_memory, formula.simplified_formula(), set(), polarity_aware)
+        cnf.insert_clauses(result)
+        for o in outputs:
+            if o.is_literal():
+                cnf.insert_dependencies(result, o, cnf.expanded_variables)
+                cnf.insert_dependencies(result, o.inverse(), cnf.expanded_variables)
+
+        literals, offsets = result.flat()
+        output_keys = [o.key() for o in outputs]
+        if n_fixed is not None:
+            renumbering = VariableRenumbering(n_fixed=n_fixed)
+            literals = array('i', [renumbering.literal(i) for i in literals])
+            output_keys = [renumbering.literal(i) if isinstance(i, int) else i for i in output_keys]
+        n_vars = max([abs(i) for i in output_keys if isinstance(i, int)] + [max(literals, default=0),
+                                                                          -min(literals, default=0)])
+        return CnfTemplate(n_vars, literals, offsets, output_keys, comments)
+
+    @staticmethod
+    def from_aig(aig, n_outputs, n_fixed, *comments):
+        """Builds the template from the CNF of an AIG (see Aig.insert_clauses()).
+
+        :param aig: the first n_outputs outputs of aig are the outputs of the template, the remaining ones are
+            the constraints, which must be True in all the instances
+        :param n_fixed: the number of the variables keeping their indices (the inputs of aig)
+        """
+        result = SatClauses()
+        outputs, n_vars = aig.insert_clauses(result, n_fixed)
+        for o in outputs[n_outputs:]:
+            if o == "False":
+                raise Exception("The constraints of the circuit are unsatisfiable")
+            if o != "True":
+                result.insert([o])
+        literals, offsets = result.flat()
+        return CnfTemplate(n_vars, literals, offsets, outputs[:n_outputs], comments)
+
+    def save(self, filename):
+        header = {"n_vars": self.n_vars, "n_clauses": self.number_of_clauses(), "n_literals": len(self.literals),
+                  "byteorder": sys.byteorder, "outputs": self.outputs, "comments": self.comments}
+        with open(filename, 'wb') as f:
+            f.write(CnfTemplate.MAGIC)
+            f.write(json.dumps(header).encode() + b"\n")
+            self.literals.tofile(f)
+            self.offsets.tofile(f)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as f:
+            if f.readline() != CnfTemplate.MAGIC:
+                raise Exception("The file " + filename + " is not a CNF template")
+            header = json.loads(f.readline())
+            literals = array('i')
+            literals.fromfile(f, header["n_literals"])
+            offsets = array('q')
+            offsets.fromfile(f, header["n_clauses"] + 1)
+        if header["byteorder"] != sys.byteorder:
+            literals.byteswap()
+            offsets.byteswap()
+        return CnfTemplate(header["n_vars"], literals, offsets, header["outputs"], header["comments"])
+
+    def number_of_vars(self):
+        return self.n_vars
+
+    def number_of_clauses(self):
+        return len(self.offsets) - 1
+
+    def assumptions(self, value):
+        """Returns the output literals (signed integers) fixing the outputs to the bits of value (e.g., for
+        pysat's solve(assumptions=...)); the outputs that are constants are checked instead.
+
+        :param value: a non-negative integer; its bits are assigned to the outputs right-to-left
+        """
+        if value >> len(self.outputs) != 0:
+            raise Exception(str(value) + " does not fit into " + str(len(self.outputs)) + " output bits")
+        result = []
+        for i, o in enumerate(self.outputs):
+            bit = (value >> i) & 1 == 1
+            if isinstance(o, str):  # a constant
+                if (o == "True") != bit:
+                    raise Exception("Output bit " + str(i) + " is the constant " + o + "; thus, " + str(value) +
+                                    " cannot be the output of the circuit")
+            else:
+                result.append(o if bit else -o)
+        return result
+
+    def unit_clauses(self, value):
+        return [[i] for i in self.assumptions(value)]
+
+    def clauses(self, value):
+        return [list(self.literals[self.offsets[j]:self.offsets[j + 1]])
+                for j in range(self.number_of_clauses())] + self.unit_clauses(value)
+
+    def store(self, filename, value, *comments):
+        """Writes the DIMACS instance for the given output value to filename.
+
+        :param filename:
+        :param value: see assumptions()
+        :param comments: instance-specific comments (preceding the comments of the template)
+        """
+        units = self.assumptions(value)
+        if self.body is None:
+            literals = self.literals
+            offsets = self.offsets
+            self.body = "".join(" ".join(map(str, literals[offsets[j]:offsets[j + 1]])) + " 0\n"
+                                for j in range(self.number_of_clauses()))
+        with open(filename, 'w') as f:
+            for c in list(comments) + self.comments:
+                f.write("c " + c + "\n")
+            f.write("p cnf " + str(self.n_vars) + " " + str(self.number_of_clauses() + len(units)) + "\n")
+            f.write(self.body)
+            f.write("".join(str(i) + " 0\n" for i in units))
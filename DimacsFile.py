@@ -1,71 +1,238 @@
 #!/usr/bin/env python3
 
+import mmap
+import os
+from array import array
+
+try:
+    import numpy
+except ImportError:  # the clauses will be parsed without NumPy
+    numpy = None
+
+
 class DimacsFile:
-    def __init__(self, filename, n_vars=0, clauses=[]):
+    def __init__(self, filename, n_vars=0, clauses=None):
+        """
+
+        :param filename:
+        :param n_vars:
+        :param clauses: a list of clauses (lists of integers), or a SatClauses instance, the flat arrays of which
+            are shared with this DimacsFile instead of being copied (until a clause is added to this DimacsFile)
+        """
         self.filename = filename
         self.n_vars = n_vars
-        self.i_clauses = clauses
+        # the clauses are stored in one flat array of literals; offsets[i]:offsets[i+1] is the slice of the i-th clause
+        self.literals = array('i')
+        self.offsets = array('q', [0])
+        self.shared_arrays = False  # whether literals and offsets belong to a SatClauses instance
         self.b_values = {}
+        if clauses is not None:
+            if hasattr(clauses, "flat"):
+                self.literals, self.offsets = clauses.flat()
+                self.shared_arrays = True
+                if len(self.literals) > 0:
+                    self.n_vars = max(self.n_vars, max(self.literals), -min(self.literals))
+            else:
+                self.add_clauses(clauses)
 
     def load(self):
-        f = open(self.filename, 'r')
-        lines = f.readlines()
-        f.close()
+        """Loads the clauses, the number of variables (from the "p cnf" header), and variable values ("v" lines).
 
+        The file is memory-mapped. The leading comment/header lines are processed one by one, while the clause
+        section is tokenized in bulk with NumPy (if available and if the section contains only clause lines,
+        each ended by 0); otherwise, the clause section is processed line by line.
+
+        :return: (literals, offsets), where literals is a flat array of the literals of all clauses, and
+            offsets[i]:offsets[i+1] is the slice of the i-th clause
+        """
         self.n_vars = 0
-        self.i_clauses = []
-        for line in lines:
-            line = line.strip()
-            if len(line) == 0:
-                continue
-            i = line.find("p cnf")
-            if i >= 0:
-                line = line[len("p cnf"):].strip()
-                i = line.find(" ")
-                line = line[:i]
-                self.n_vars = int(line)
-                continue
-            if line[0].isalpha():
-                if line[0] == 'v':  # variable assignments as positive or negative integers
-                    for s in line[1:].strip().split():
-                        i = int(s)
-                        if i > 0:
-                            self.b_values[i] = True
-                        if i < 0:
-                            self.b_values[-i] = False
-                else:
-                    pass
+        self.literals = array('i')
+        self.offsets = array('q', [0])
+        self.shared_arrays = False
+        with open(self.filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self.literals, self.offsets
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                while pos < len(mm):
+                    end = mm.find(b"\n", pos)
+                    end = len(mm) if end < 0 else end + 1
+                    line = mm[pos:end].decode()
+                    if DimacsFile.is_clause_line(line):
+                        break
+                    self.parse_line(line)  # not a clause line
+                    pos = end
+                if self.load_clause_section(mm, pos):
+                    return self.literals, self.offsets
+                body = mm[pos:]
 
-            elif line.find("--")==0:  # some awkward comment
-                pass
-            else: # the line contains a clause (integers ended by 0)
-                clause = []
-                for s in line.split():
-                    i = int(s)
-                    if i == 0:
-                        break  # end of clause
-                    clause.append(i)
+        for line in body.decode().splitlines():
+            clause = self.parse_line(line)
+            if clause is not None:
                 self.add_clause(clause)
+        return self.literals, self.offsets
+
+    @staticmethod
+    def is_clause_line(line):
+        line = line.strip()
+        return len(line) > 0 and line.find("p cnf") < 0 and not line[0].isalpha() and line.find("--") != 0
+
+    def parse_line(self, line):
+        """Processes the header and "v" lines; returns the clause (a list of integers) for a clause line,
+        or None for other lines."""
+        line = line.strip()
+        if len(line) == 0:
+            return None
+        i = line.find("p cnf")
+        if i >= 0:
+            line = line[len("p cnf"):].strip()
+            i = line.find(" ")
+            line = line[:i]
+            self.n_vars = int(line)
+            return None
+        if line[0].isalpha():
+            if line[0] == 'v':  # variable assignments as positive or negative integers
+                for s in line[1:].strip().split():
+                    i = int(s)
+                    if i > 0:
+                        self.b_values[i] = True
+                    if i < 0:
+                        self.b_values[-i] = False
+            else:
+                pass
+
+        elif line.find("--")==0:  # some awkward comment
+            pass
+        else: # the line contains a clause (integers ended by 0)
+            clause = []
+            for s in line.split():
+                i = int(s)
+                if i == 0:
+                    break  # end of clause
+                clause.append(i)
+            return clause
+        return None
+
+    def iter_clauses(self, batch_size=None, chunk_size=1 << 20):
+        """Reads the file in chunks of chunk_size bytes and yields its clauses without storing them,
+        so that the memory used does not depend on the size of the file.
+        The header and "v" lines are processed as in load().
+
+        :param batch_size: if set, lists of up to batch_size clauses are yielded instead of single clauses
+        :param chunk_size: the number of bytes to read at once
+        """
+        batch = []
+        leftover = b""  # the beginning of a line split by the chunk boundary
+        with open(self.filename, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if len(chunk) == 0:
+                    lines = [leftover]
+                else:
+                    chunk = leftover + chunk
+                    end = chunk.rfind(b"\n") + 1
+                    lines = chunk[:end].splitlines()
+                    leftover = chunk[end:]
+                for line in lines:
+                    clause = self.parse_line(line.decode())
+                    if clause is None:
+                        continue
+                    for i in clause:
+                        if i > self.n_vars or -i > self.n_vars:
+                            self.n_vars = abs(i)
+                    if batch_size is None:
+                        yield clause
+                    else:
+                        batch.append(clause)
+                        if len(batch) == batch_size:
+                            yield batch
+                            batch = []
+                if len(chunk) == 0:
+                    break
+        if len(batch) > 0:
+            yield batch
+
+    def load_clause_section(self, buffer, offset=0):
+        """Parses the clause lines in buffer[offset:] with NumPy.
+
+        The bytes are parsed in place (the buffer, e.g., the memory-mapped file, is not copied).
+
+        :param buffer: a read-only bytes-like object (e.g., bytes or a read-only mmap) that supports find()
+        :param offset: the position of the clause section in the buffer
+        :return: False, if NumPy is not available, or the clause section has to be parsed line by line
+            (e.g., it contains comments, or some line does not consist of exactly one clause ended by 0)
+        """
+        if numpy is None or buffer.find(b"--", offset) >= 0:
+            return False
+
+        chars = numpy.frombuffer(buffer, dtype=numpy.uint8, offset=offset)
+        clause_bytes = numpy.zeros(256, dtype=bool)
+        clause_bytes[numpy.frombuffer(b"0123456789- \t\n", dtype=numpy.uint8)] = True
+        if not clause_bytes[chars].all():
+            return False
+
+        # each non-empty line must end with the token 0; the last line may lack the final newline
+        line_ends = numpy.flatnonzero(chars == ord("\n"))
+        if len(chars) > 0 and chars[-1] != ord("\n"):
+            line_ends = numpy.append(line_ends, len(chars))
+        line_ends = line_ends[(line_ends > 0) & (chars[line_ends - 1] != ord("\n"))]  # non-empty lines only
+        if len(line_ends) == 0:
+            return True
+        if numpy.any(chars[line_ends - 1] != ord("0")):
+            return False
+        before_zero = chars[numpy.maximum(line_ends - 2, 0)]
+        if numpy.any((line_ends >= 2) & (before_zero != ord(" ")) & (before_zero != ord("\t"))
+                     & (before_zero != ord("\n"))):
+            return False
+
+        tokens = numpy.fromstring(chars, dtype=numpy.int64, sep=" ")
+        zeros = numpy.flatnonzero(tokens == 0)
+        if len(zeros) != len(line_ends):
+            return False  # some line contains more than one 0
+        literals = tokens[tokens != 0]
+        if len(literals) > 0:
+            max_var = int(numpy.abs(literals).max())
+            if max_var >= 2**31:
+                return False
+            self.n_vars = max(self.n_vars, max_var)
+
+        self.literals.frombytes(literals.astype(numpy.int32).tobytes())
+        self.offsets.frombytes((zeros - numpy.arange(len(zeros))).astype(numpy.int64).tobytes())
+        return True
 
     def number_of_vars(self):
         return self.n_vars
 
     def number_of_clauses(self):
-        return len(self.i_clauses)
+        return len(self.offsets) - 1
 
     def clauses(self):
-        return self.i_clauses
+        return [list(c) for c in self.iter_stored_clauses()]
+
+    def iter_stored_clauses(self):
+        # yields the clauses as slices of the flat literal array
+        literals = self.literals
+        offsets = self.offsets
+        for j in range(len(offsets) - 1):
+            yield literals[offsets[j]:offsets[j + 1]]
 
     def add_clause(self, clause):
         self.add_clauses([clause])
 
     def add_clauses(self, clauses):
+        if self.shared_arrays:
+            # copy on the first change: appending to the arrays of SatClauses would bypass its duplicate detection
+            self.literals = array('i', self.literals)
+            self.offsets = array('q', self.offsets)
+            self.shared_arrays = False
         for c in clauses:
             # if the clause contains index abs(i) > nVars, update nVars
             for i in c:
-                self.n_vars = max(self.n_vars, abs(i))
+                if i > self.n_vars or -i > self.n_vars:
+                    self.n_vars = abs(i)
             # append the new clause:
-            self.i_clauses.append(c)
+            self.literals.extend(c)
+            self.offsets.append(len(self.literals))
 
     def set_value(self, i, value):
         self.b_values[abs(i)] = value
@@ -77,15 +244,27 @@ class DimacsFile:
     def get_value(self, i):
         return self.b_values[abs(i)]
 
-    def is_satisfiable(self):
-        for i in range(1, self.n_vars+1):
-            if i not in self.b_values:
-                raise Exception("Not all variables have values. Variable "+str(i)+" does not.")
+    def is_satisfiable(self, clauses=None):
+        """Checks whether the variable values satisfy all the clauses.
+
+        :param clauses: if set, an iterable of clauses (e.g., DimacsFile(cnf_filename).iter_clauses()) to be checked
+            in a single pass instead of the stored ones
+        """
+        if clauses is None:
+            for i in range(1, self.n_vars+1):
+                if i not in self.b_values:
+                    raise Exception("Not all variables have values. Variable "+str(i)+" does not.")
+            if numpy is not None:
+                return len(self.unsatisfied_clauses()) == 0
+            clauses = self.iter_stored_clauses()
 
-        for c in self.clauses():
+        b_values = self.b_values
+        for c in clauses:
             clause_sat = False
             for i in c:
-                if (i > 0 and self.get_value(i)) or (i < 0 and not self.get_value(-i)):
+                if abs(i) not in b_values:
+                    raise Exception("Not all variables have values. Variable "+str(abs(i))+" does not.")
+                if (i > 0 and b_values[i]) or (i < 0 and not b_values[-i]):
                     clause_sat = True
                     break  # the clause
             if not clause_sat:
@@ -93,18 +272,70 @@ class DimacsFile:
 
         return True  # here all clauses have been satisfied
 
+    def model_array(self, model=None):
+        """Converts a model to a NumPy bool array indexed by variable (the element 0 is unused).
+
+        :param model: a list of non-zero literals, e.g., returned by pysat's get_model(), where i means x_i=True
+            and -i means x_i=False; if None, the values set by set_value() or loaded from "v" lines are used
+        :raises Exception: if some variable x_1..x_n_vars has no value
+        """
+        if model is None:
+            variables = numpy.fromiter(self.b_values.keys(), dtype=numpy.int64, count=len(self.b_values))
+            values = numpy.fromiter(self.b_values.values(), dtype=bool, count=len(self.b_values))
+        else:
+            model = numpy.asarray(model, dtype=numpy.int64)
+            variables = numpy.abs(model)
+            values = model > 0
+        result = numpy.zeros(max(self.n_vars, int(variables.max(initial=0))) + 1, dtype=bool)
+        result[variables] = values
+        assigned = numpy.zeros(len(result), dtype=bool)
+        assigned[variables] = True
+        missing = numpy.flatnonzero(~assigned[1:])
+        if len(missing) > 0:
+            raise Exception("Not all variables have values. Variable "+str(int(missing[0]) + 1)+" does not.")
+        return result
+
+    def unsatisfied_clauses(self, model=None):
+        """Evaluates all the stored clauses at once and returns the indices of the unsatisfied ones.
+
+        :param model: a NumPy bool/int8 array indexed by variable (model[i] is the value of x_i; model[0] is unused),
+            or a list of non-zero literals (see model_array()); if None, the values set by set_value()
+            or loaded from "v" lines are used
+        :return: a NumPy array of clause indices (a list, if NumPy is not available)
+        """
+        if numpy is None:
+            b_values = self.b_values if model is None else {abs(i): i > 0 for i in model}
+            return [j for j, c in enumerate(self.iter_stored_clauses())
+                    if not any((i > 0) == b_values[abs(i)] for i in c)]
+
+        if model is None or not isinstance(model, numpy.ndarray):
+            model = self.model_array(model)
+        n_clauses = self.number_of_clauses()
+        if len(self.literals) == 0:
+            return numpy.arange(n_clauses)  # all the clauses (if any) are empty
+
+        literals = numpy.frombuffer(self.literals, dtype=numpy.int32)
+        offsets = numpy.frombuffer(self.offsets, dtype=numpy.int64)
+        variables = numpy.abs(literals)
+        if variables.max() >= len(model):
+            raise Exception("Not all variables have values. Variable "+str(variables.max())+" does not.")
+        literal_values = model.astype(bool, copy=False)[variables] != (literals < 0)
+
+        # empty clauses are unsatisfied; the others are reduced by OR over their slices of literal_values
+        starts = offsets[:-1]
+        non_empty = offsets[1:] > starts
+        clause_values = numpy.zeros(n_clauses, dtype=bool)
+        clause_values[non_empty] = numpy.logical_or.reduceat(literal_values, starts[non_empty])
+        return numpy.flatnonzero(~clause_values)
+
     def store(self, *comments):
         f = open(self.filename, 'w')
         for c in comments:
             f.write("c " + c + "\n")
         f.write("p cnf " + str(self.number_of_vars()) + " " + str(self.number_of_clauses()) + "\n")
 
-        for c in self.clauses():
-            s = ""
-            for i in c:
-                s += str(i) + " "
-            s += "0"
-            f.write(s + "\n")
+        for c in self.iter_stored_clauses():
+            f.write(" ".join(map(str, c)) + " 0\n")
         f.close()
 
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import os
+
+
+class DimacsWriter:
+    """Writes clauses to a DIMACS file as they are produced, without keeping them in memory.
+
+    Since the number of variables and clauses is not known in advance, a fixed-width "p cnf" header line is
+    reserved after the comments and patched in place when the writer is closed. If the writer is used as
+    a context manager and an exception is raised, the incomplete file is removed.
+    """
+
+    HEADER_WIDTH = 48  # enough for "p cnf <vars> <clauses>" with up to 20-digit numbers
+    BUFFER_SIZE = 1 << 16  # the number of clause lines to collect before writing them to disk
+
+    def __init__(self, filename, *comments, n_vars=0):
+        self.filename = filename
+        self.n_vars = n_vars
+        self.n_clauses = 0
+        self.lines = []
+        self.f = open(filename, 'w')
+        for c in comments:
+            self.f.write("c " + c + "\n")
+        self.header_pos = self.f.tell()
+        self.f.write(self.header() + "\n")
+
+    def header(self):
+        return ("p cnf " + str(self.n_vars) + " " + str(self.n_clauses)).ljust(DimacsWriter.HEADER_WIDTH)
+
+    def number_of_vars(self):
+        return self.n_vars
+
+    def number_of_clauses(self):
+        return self.n_clauses
+
+    def add_clause(self, clause):
+        for i in clause:
+            if i > self.n_vars or -i > self.n_vars:
+                self.n_vars = abs(i)
+        self.lines.append(" ".join(map(str, clause)))
+        self.n_clauses += 1
+        if len(self.lines) >= DimacsWriter.BUFFER_SIZE:
+            self.flush()
+
+    def add_clauses(self, clauses):
+        for c in clauses:
+            self.add_clause(c)
+
+    def flush(self):
+        if len(self.lines) > 0:
+            self.f.write(" 0\n".join(self.lines) + " 0\n")
+            self.lines = []
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        header = self.header()
+        if len(header) > DimacsWriter.HEADER_WIDTH:
+            raise Exception("The header \"" + header + "\" does not fit into the reserved space")
+        self.f.seek(self.header_pos)
+        self.f.write(header)
+        self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def discard(self):
+        """Closes the file without patching the header and removes it."""
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        os.remove(self.filename)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()  # the clauses are incomplete, and the reserved header would claim 0 clauses
+        else:
+            self.close()
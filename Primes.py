@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import random
+
+SMALL_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97]
+
+# for n < 3317044064679887385961981, the Miller-Rabin test with these bases is deterministic
+DETERMINISTIC_BASES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+DETERMINISTIC_LIMIT = 3317044064679887385961981
+
+
+def is_prime(n, rng=None, rounds=32):
+    """The Miller-Rabin primality test: exact for n < DETERMINISTIC_LIMIT, probabilistic (with the error
+    probability at most 4^-rounds) for larger n.
+
+    :param n:
+    :param rng: a random.Random instance for choosing the bases for large n
+    :param rounds: the number of random bases for large n
+    """
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+
+    # n-1 = d * 2^s, where d is odd
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    if n < DETERMINISTIC_LIMIT:
+        bases = DETERMINISTIC_BASES
+    else:
+        rng = rng or random.Random()
+        bases = [rng.randrange(2, n - 1) for _ in range(rounds)]
+
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False  # a is a witness that n is composite
+    return True
+
+
+def random_prime(bits, rng):
+    """Returns a random prime with exactly the given number of bits (i.e., the most significant bit is 1).
+
+    :param bits: at least 2
+    :param rng: a random.Random instance (for reproducibility)
+    """
+    if bits < 2:
+        raise Exception("There are no primes with less than 2 bits")
+    while True:
+        n = rng.getrandbits(bits) | (1 << (bits - 1)) | 1  # odd, exactly bits bits
+        if bits == 2:
+            n = rng.choice([2, 3])
+        if is_prime(n, rng):
+            return n
+
+
+def random_semiprime(bits, rng):
+    """Returns (n, p, q), where n=p*q has exactly the given number of bits, and p>q are primes
+    with ceil(bits/2) and floor(bits/2) bits (except for 4-bit n, where p has 3 bits).
+
+    :param bits: at least 4
+    :param rng: a random.Random instance (for reproducibility)
+    """
+    if bits < 4:
+        raise Exception("There are no semiprimes with distinct factors and less than 4 bits")
+    p_bits = (bits + 1) // 2
+    q_bits = bits // 2
+    if bits == 4:
+        p_bits = 3  # 2-bit primes 2 and 3 are too small
+    while True:
+        p = random_prime(p_bits, rng)
+        q = random_prime(q_bits, rng)
+        if p == q:
+            continue
+        n = p * q
+        if n.bit_length() == bits:
+            return n, max(p, q), min(p, q)
@@ -1,72 +1,90 @@
 #!/usr/bin/env python3
 
-import sys  # for argv
+import argparse
+import os
 
 from SatMemory import SatMemory
 from SatInteger import SatInteger
 from SatFormula import *
+from Aig import Aig
 from CNF import CNF
-from DimacsFile import DimacsFile
+from CnfTemplate import CnfTemplate
+from CnfSimplifier import CnfSimplifier
+from SatSweeper import SatSweeper
+from VariableRenumbering import VariableRenumbering
+from DimacsWriter import DimacsWriter
 from BitUtils import *
 
-if __name__ == "__main__":
 
-    if len(sys.argv) < 3 or len(sys.argv) > 4:
-        print("Usage for known factors <p> and <q>:")
-        print("  " + sys.argv[0] + " <p> <q>")
-        print("Usage for unknown factors of <n>, where n=p*q:")
-        print("  " + sys.argv[0] + " <n> <#bits-of-p> <#bits-of-q>")
-        print("Unique solution:")
-        print("  In order to generate a SAT instance with the UNIQUE solution, n must be a product of two distinct "
-              "primes!")
-        exit(0)
-    if len(sys.argv) == 3:
-        # args are: p and q
-        given_p = int(sys.argv[1])
-        given_q = int(sys.argv[2])
-        given_p, given_q = max(given_p, given_q), min(given_p, given_q)
-        if given_p <= 1 or given_q <= 1:
-            raise Exception("<p> and <q> must be positive factors greater than 1")
-        n = given_p * given_q
-        p_bits = bits_required(given_p)
-        q_bits = bits_required(given_q)
-    elif len(sys.argv) == 4:
-        # args are: n #bits-of-p #bits-of-q
-        n = int(sys.argv[1])
-        if n < 4:
-            raise Exception("<n> must be a positive product of two positive factors greater than 1, i.e., n>=4")
-        p_bits = int(sys.argv[2])
-        q_bits = int(sys.argv[3])
-
-    # adding one more bit to each factor, since we use two's complement notation,
-    # and we want the most significant bit to be zero (in order to exclude negative numbers)
-    p_bits += 1
-    q_bits += 1
-    # make p and q of equal length, since our SatInteger.product_with() currently
-    # does not support multiplying numbers of different length
-    p_bits = q_bits = max(p_bits, q_bits)
-
-    n_bits = p_bits + q_bits
+def factor_widths(p_bits, q_bits, pad=False):
+    """Returns the widths of the SatInteger factors for p and q with the given numbers of bits.
+
+    Since p>=q is required, p gets the larger width. The product has p_bits+q_bits bits.
+    :param pad: whether to extend both factors to the same power-of-2 width (as in the original generator,
+        where the Karatsuba multiplication supported only such widths, and the factors had a sign bit)
+    """
+    p_bits, q_bits = max(p_bits, q_bits), min(p_bits, q_bits)
+    if not pad:
+        return p_bits, q_bits
+    # adding one more bit to each factor (the sign bit in two's complement notation)
+    n_bits = 2 * (p_bits + 1)
     # ^^^important: do not use n_bits = bits_required(n), since there could be not enough bits for n
     #               counter-example: 5*3=15 or 3 bits * 2 bits = 4 bits; 4/2-bits are not sufficient
 
     n_bits = power_of_2(n_bits)
-    p_bits = q_bits = n_bits // 2
-    print(str(n_bits) + "-bit product = ", str(p_bits) + "-bit factor", " x ", str(q_bits) + "-bit factor")
+    return n_bits // 2, n_bits // 2
 
-    mem = SatMemory(p_bits + q_bits)  # number of free vars
+
+def factor_vars(p_bits, q_bits):
+    """Returns the names of the variables for the bits of p and q (right-to-left)."""
     p_vars = ["x" + str(k) for k in range(1, p_bits + 1)]
-    p = SatInteger(mem, p_vars)
     q_vars = ["x" + str(k) for k in range(p_bits + 1, p_bits + q_bits + 1)]
+    return p_vars, q_vars
+
+
+def build_circuit(p_bits, q_bits, optimize=True, adder="ripple", schoolbook_bits=SatInteger.SCHOOLBOOK_BITS,
+                  multiplier="karatsuba", toom3_bits=SatInteger.TOOM3_BITS, base_multiplier="array", sweep=False):
+    """Builds the product of two factors of the given widths and the constraints on the factors (not depending on n).
+
+    :param adder: the adder architecture (see SatInteger.sum_with())
+    :param schoolbook_bits: see SatInteger.product_with()
+    :param multiplier: see SatInteger.product_with()
+    :param toom3_bits: see SatInteger.product_with()
+    :param base_multiplier: see SatInteger.product_with()
+    :param sweep: whether to merge the equivalent nodes of the circuit (see SatSweeper)
+
+    :return: (mem, p, q, pq, conjuncts)
+    """
+    mem = SatMemory(p_bits + q_bits)  # number of free vars
+    p_vars, q_vars = factor_vars(p_bits, q_bits)
+    p = SatInteger(mem, p_vars)
     q = SatInteger(mem, q_vars)
 
-    pq = p.product_with(q, True)  # the last argument specifies whether to optimize multiplication
+    # the product of unsigned p and q has p_bits+q_bits bits (no overflow)
+    pq = p.product_with(q, optimize, adder, schoolbook_bits, multiplier, toom3_bits, base_multiplier)
 
-    n_len = len(pq.literals)
+    # conjuncts that ensure unique solution:
     conjuncts = []
+    # 1) exclude factors equal to 1
+    conjuncts.append(Or(mem, p.literals[1:]))  # at least one non-zero p bit (not counting the least significant)
+    conjuncts.append(Or(mem, q.literals[1:]))  # at least one non-zero q bit (not counting the least significant)
+    # 2) ensuring p>=q
+    conjuncts.append(p.compare_ge(q.clipped(p_bits)))
+
+    if sweep:
+        outputs = SatSweeper(mem, pq.literals + conjuncts).sweep()
+        pq = SatInteger(mem, outputs[:pq.n_bits])
+        conjuncts = outputs[pq.n_bits:]
+    return mem, p, q, pq, conjuncts
+
+
+def product_bit_conjuncts(pq, n):
     # conjuncts corresponding to the product bits:
+    if n >> len(pq.literals) != 0:
+        raise Exception(str(n) + " does not fit into " + str(len(pq.literals)) + " output bits")
+    conjuncts = []
     nn = n
-    for i in range(n_len):
+    for i in range(len(pq.literals)):
         bit = nn % 2
         print("bit " + str(i) + " = " + str(bit))
         nn = nn // 2
@@ -74,32 +92,215 @@ if __name__ == "__main__":
             conjuncts.append(pq.literals[i])
         else:
             conjuncts.append(pq.literals[i].inverse())
+    return conjuncts
+
+
+def factor_comments(p, q):
+    return ["the bits of the first factor (right-to-left): " + str(p),
+            "the bits of the second factor (right-to-left): " + str(q)]
 
-    # conjuncts that ensure unique solution:
-    # 1) exclude negative numbers
-    conjuncts.append(p.literals[-1].inverse())  # the most significant p bit is 0
-    conjuncts.append(q.literals[-1].inverse())  # the most significant q bit is 0
-    # 2) exclude factors equal to 1
-    conjuncts.append(Or(mem, p.literals[1:]))  # at least one non-zero p bit (not counting the least significant)
-    conjuncts.append(Or(mem, q.literals[1:]))  # at least one non-zero q bit (not counting the least significant)
-    # 3) ensuring p-q>=0 that is the most significant bit of (p-q) is 0
-    diff = p.sum_with(q.negation())
-    conjuncts.append(diff.literals[-1].inverse())
 
-    expected_result = And(mem, conjuncts)
+def instance_size(template):
+    # the number of variables and clauses of the instances of the template (with the unit clauses for the outputs)
+    return template.number_of_vars(), template.number_of_clauses() + sum(isinstance(o, int) for o in template.outputs)
 
-    cnf = CNF(mem, expected_result)
-    clauses = cnf.clauses()
 
-    df = DimacsFile(str(n) + ".cnf")
-    df.add_clauses(clauses)
+def aig_template(mem, p, q, pq, conjuncts):
+    """Builds the CnfTemplate of the circuit (see build_circuit()) via the optimized AIG (see Aig).
 
+    The AIG does not always give a smaller CNF (e.g., for some ripple-carry circuits, the rewritten cuts need
+    more variables or clauses than the native XOR/majority nodes); the template built directly from the circuit
+    is returned instead, unless the AIG has neither more variables nor more clauses.
+    """
+    circuit = Aig.from_circuit(mem, pq.literals + conjuncts).optimized()
+    template = CnfTemplate.from_aig(circuit, pq.n_bits, p.n_bits + q.n_bits, *factor_comments(p, q))
+    direct = CnfTemplate.build(mem, And(mem, conjuncts), pq.literals, *factor_comments(p, q),
+                               n_fixed=p.n_bits + q.n_bits)
+    aig_vars, aig_clauses = instance_size(template)
+    direct_vars, direct_clauses = instance_size(direct)
+    if aig_vars <= direct_vars and aig_clauses <= direct_clauses:
+        return template
+    return direct
+
+
+templates = {}  # template file name -> CnfTemplate (loaded in this process)
+
+
+def template_for(p_bits, q_bits, optimize, template_dir, polarity_aware=False, adder="ripple",
+                 schoolbook_bits=SatInteger.SCHOOLBOOK_BITS, multiplier="karatsuba", toom3_bits=SatInteger.TOOM3_BITS,
+                 base_multiplier="array", renumber=True, sweep=False, aig=False):
+    """Loads the CNF template for the given widths and options from template_dir, or builds and saves it there."""
+    if aig and polarity_aware:
+        raise Exception("The polarity-aware encoding is not supported for the AIG")
+    filename = os.path.join(template_dir, "product_" + str(p_bits) + "x" + str(q_bits) +
+                            ("_schoolbook" + str(schoolbook_bits) if optimize else "_plain") +
+                            ("_pg" if polarity_aware else "") +
+                            ("" if adder == "ripple" else "_" + adder) +
+                            ("" if multiplier == "karatsuba" else "_" + multiplier + "-" + str(toom3_bits)) +
+                            ("" if base_multiplier == "array" else "_" + base_multiplier) +
+                            ("_swept" if sweep else "") +
+                            ("_aig" if aig else ("" if renumber else "_sparse")) + ".tpl")
+    if filename in templates:
+        return templates[filename]
+    if os.path.exists(filename):
+        templates[filename] = CnfTemplate.load(filename)
+        return templates[filename]
+    mem, p, q, pq, conjuncts = build_circuit(p_bits, q_bits, optimize, adder, schoolbook_bits, multiplier,
+                                             toom3_bits, base_multiplier, sweep)
+    if aig:
+        template = aig_template(mem, p, q, pq, conjuncts)
+    else:
+        template = CnfTemplate.build(mem, And(mem, conjuncts), pq.literals, *factor_comments(p, q),
+                                     polarity_aware=polarity_aware, n_fixed=p_bits + q_bits if renumber else None)
+    os.makedirs(template_dir, exist_ok=True)
+    # saving under a temporary name first, since several processes may build the same template
+    tmp_filename = filename + "." + str(os.getpid())
+    template.save(tmp_filename)
+    os.replace(tmp_filename, filename)
+    print("saved the template " + filename)
+    templates[filename] = template
+    return template
+
+
+def instance_comment(n, given_p=None, given_q=None):
     comment = "SAT instance for factoring " + str(n)
     if given_p is not None and given_q is not None:
         comment += " = " + str(given_p) + " x " + str(given_q)
     else:
         comment += " with unknown factors"
-    comment1 = "the bits of the first factor (right-to-left): " + str(p)
-    comment2 = "the bits of the second factor (right-to-left): " + str(q)
+    return comment
+
+
+def generate(filename, n, p_bits, q_bits, given_p=None, given_q=None, template_dir=None, optimize=True,
+             polarity_aware=False, adder="ripple", schoolbook_bits=SatInteger.SCHOOLBOOK_BITS, multiplier="karatsuba",
+             toom3_bits=SatInteger.TOOM3_BITS, base_multiplier="array", simplify=False, renumber=True,
+             sweep=False, aig=False):
+    """Writes the SAT instance for factoring n into the factors of the given widths (see factor_widths()).
+
+    :param template_dir: if set, the instance is produced from the CNF template for the given widths
+        (see template_for())
+    :param polarity_aware: whether to use the Plaisted-Greenbaum encoding (see CNF)
+    :param adder: the adder architecture (see SatInteger.sum_with())
+    :param schoolbook_bits: see SatInteger.product_with()
+    :param multiplier: see SatInteger.product_with()
+    :param toom3_bits: see SatInteger.product_with()
+    :param base_multiplier: see SatInteger.product_with()
+    :param simplify: whether to simplify the instance by CnfSimplifier (the variables of the factors are kept)
+    :param renumber: whether to renumber the auxiliary variables densely (see VariableRenumbering); the variables
+        of the factors keep their indices
+    :param sweep: whether to merge the equivalent nodes of the circuit before the CNF expansion (see SatSweeper)
+    :param aig: whether to optimize the circuit as an AIG and to emit the CNF from it (see Aig); the variables of
+        the AIG are numbered densely anyway
+    :return: (the number of variables, the number of clauses)
+    """
+    comment = instance_comment(n, given_p, given_q)
+    if aig and polarity_aware:
+        raise Exception("The polarity-aware encoding is not supported for the AIG")
+    if template_dir is not None or aig:
+        if template_dir is not None:
+            template = template_for(p_bits, q_bits, optimize, template_dir, polarity_aware, adder, schoolbook_bits,
+                                    multiplier, toom3_bits, base_multiplier, renumber, sweep, aig)
+        else:
+            template = aig_template(*build_circuit(p_bits, q_bits, optimize, adder, schoolbook_bits, multiplier,
+                                                  toom3_bits, base_multiplier, sweep))
+        if not simplify:
+            template.store(filename, n, comment)
+            return template.number_of_vars(), template.number_of_clauses() + len(template.assumptions(n))
+        clauses = template.clauses(n)
+        comments = template.comments
+    else:
+        mem, p, q, pq, conjuncts = build_circuit(p_bits, q_bits, optimize, adder, schoolbook_bits, multiplier,
+                                                 toom3_bits, base_multiplier, sweep)
+        expected_result = And(mem, product_bit_conjuncts(pq, n) + conjuncts)
+
+        cnf = CNF(mem, expected_result, set(), polarity_aware)
+        comments = factor_comments(p, q)
+        if not simplify:
+            # the clauses are written to the file as soon as they are produced
+            # (the "p cnf" header is patched at the end)
+            with DimacsWriter(filename, comment, *comments, n_vars=p_bits + q_bits) as writer:
+                cnf.store_clauses(VariableRenumbering(writer, p_bits + q_bits) if renumber else writer)
+            return writer.number_of_vars(), writer.number_of_clauses()
+        clauses = cnf.clauses()
+
+    # the simplifier keeps the variables of the factors; thus, the comments on the factors remain valid
+    simplifier = CnfSimplifier(clauses, range(1, p_bits + q_bits + 1))
+    simplifier.simplify()
+    with DimacsWriter(filename, comment, *comments, n_vars=p_bits + q_bits) as writer:
+        simplifier.store_clauses(VariableRenumbering(writer, p_bits + q_bits) if renumber else writer)
+    return writer.number_of_vars(), writer.number_of_clauses()
+
+
+USAGE = """
+Usage for known factors <p> and <q>:
+  %(prog)s <p> <q>
+Usage for unknown factors of <n>, where n=p*q:
+  %(prog)s <n> <#bits-of-p> <#bits-of-q>
+Unique solution:
+  In order to generate a SAT instance with the UNIQUE solution, n must be a product of two distinct primes!
+"""
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(usage=USAGE)
+    parser.add_argument("numbers", type=int, nargs="+", help="<p> <q>, or <n> <#bits-of-p> <#bits-of-q>")
+    parser.add_argument("--template-dir", help="the directory of the CNF templates (built once per factor widths "
+                                               "and reused for each n)")
+    parser.add_argument("--polarity-aware", action="store_true",
+                        help="use the Plaisted-Greenbaum encoding: only one direction of the equivalence is encoded "
+                             "for each gate (fewer clauses, the same solutions for the factors)")
+    parser.add_argument("--adder", choices=SatInteger.ADDERS, default="ripple",
+                        help="the adder architecture used in the circuit (default: ripple)")
+    parser.add_argument("--schoolbook-bits", type=int, default=SatInteger.SCHOOLBOOK_BITS,
+                        help="multiply by the schoolbook method instead of Karatsuba when the shorter operand has "
+                             "at most this number of bits (default: " + str(SatInteger.SCHOOLBOOK_BITS) + ")")
+    parser.add_argument("--base-multiplier", choices=SatInteger.BASE_MULTIPLIERS, default="array",
+                        help="the multiplier for the operands up to --schoolbook-bits: array, or the Wallace/Dadda "
+                             "tree (default: array)")
+    parser.add_argument("--multiplier", choices=SatInteger.MULTIPLIERS, default="karatsuba",
+                        help="the multiplication algorithm for long factors (default: karatsuba)")
+    parser.add_argument("--toom3-bits", type=int, default=SatInteger.TOOM3_BITS,
+                        help="with --multiplier toom3, multiply by Karatsuba when the shorter operand has at most "
+                             "this number of bits (default: " + str(SatInteger.TOOM3_BITS) + ")")
+    parser.add_argument("--sweep", action="store_true",
+                        help="merge the functionally equivalent nodes of the circuit (found by simulation and proven "
+                             "by a SAT solver) before the CNF expansion; requires python-sat")
+    parser.add_argument("--aig", action="store_true",
+                        help="optimize the circuit as an And-Inverter Graph (balancing and 4-input cut rewriting) "
+                             "and emit the CNF from it")
+    parser.add_argument("--simplify", action="store_true",
+                        help="simplify the instance (by unit propagation, equivalent literal substitution, "
+                             "subsumption and bounded variable elimination), keeping the variables of the factors")
+    parser.add_argument("--keep-indices", action="store_true",
+                        help="keep the indices of the auxiliary variables (by default, the variables occurring in "
+                             "the clauses are renumbered densely; the variables of the factors keep their indices)")
+    parser.add_argument("--pad", action="store_true",
+                        help="extend both factors to the same power-of-2 width (as in the original generator)")
+    args = parser.parse_args()
+    if len(args.numbers) < 2 or len(args.numbers) > 3:
+        parser.print_usage()
+        exit(0)
+
+    given_p = given_q = None
+    if len(args.numbers) == 2:
+        # args are: p and q
+        given_p, given_q = max(args.numbers), min(args.numbers)
+        if given_p <= 1 or given_q <= 1:
+            raise Exception("<p> and <q> must be positive factors greater than 1")
+        n = given_p * given_q
+        p_bits = bits_required(given_p)
+        q_bits = bits_required(given_q)
+    else:
+        # args are: n #bits-of-p #bits-of-q
+        n, p_bits, q_bits = args.numbers
+        if n < 4:
+            raise Exception("<n> must be a positive product of two positive factors greater than 1, i.e., n>=4")
+
+    p_bits, q_bits = factor_widths(p_bits, q_bits, args.pad)
+    print(str(p_bits + q_bits) + "-bit product = ", str(p_bits) + "-bit factor", " x ", str(q_bits) + "-bit factor")
 
-    df.store(comment, comment1, comment2)
+    generate(str(n) + ".cnf", n, p_bits, q_bits, given_p, given_q, args.template_dir,
+             polarity_aware=args.polarity_aware, adder=args.adder, schoolbook_bits=args.schoolbook_bits,
+             multiplier=args.multiplier, toom3_bits=args.toom3_bits, base_multiplier=args.base_multiplier,
+             simplify=args.simplify, renumber=not args.keep_indices, sweep=args.sweep,
+             aig=args.aig)
@@ -1,26 +1,87 @@
+from array import array
+
+
 class SatClauses:
-    def __init__(self):
-        self.existing_clauses_keys = set()
-        self.clauses = []
+    # The clauses are stored compactly: all literals in one flat array (each clause sorted, without
+    # duplicate literals), and offsets[i]:offsets[i+1] is the slice of the i-th clause.
+    # Duplicate clauses are detected via an open-addressing hash table of clause indices keyed by
+    # the hash of the sorted literal tuple (colliding clauses are compared literal by literal).
+
+    INITIAL_TABLE_SIZE = 1024  # must be a power of 2
+
+    def __init__(self, sink=None):
+        """
+
+        :param sink: if set (e.g., a DimacsWriter), new clauses are also passed to sink.add_clause();
+            the flat literal array is still kept, since it backs the duplicate detection
+        """
+        self.literals = array('i')
+        self.offsets = array('q', [0])
+        self.table = array('q', [-1]) * SatClauses.INITIAL_TABLE_SIZE  # clause indices (-1 for empty slots)
+        self.sink = sink
 
     def insert(self, clause):
-        new_clause = []
+        literal_set = set(map(int, clause))
         # remove x and -x:
-        for x in clause:
-            if -int(x) in clause:
+        for x in literal_set:
+            if -x in literal_set:
                 return  # both x and -x are found, the clause is always True
-            else:
-                new_clause.append(int(x))
 
-        if len(new_clause) == 0:
+        if len(literal_set) == 0:
             return  # do not add an empty clause
 
-        new_clause.sort()
+        new_clause = tuple(sorted(literal_set))
+
+        i = self.find_slot(new_clause)
+        if self.table[i] >= 0:
+            return  # a duplicate clause
+
+        self.table[i] = len(self.offsets) - 1
+        self.literals.extend(new_clause)
+        self.offsets.append(len(self.literals))
+        if self.sink is not None:
+            self.sink.add_clause(new_clause)
+        if 2 * len(self.offsets) > len(self.table):
+            self.grow_table()
+
+    def find_slot(self, new_clause):
+        # returns the table slot containing either the given clause, or -1 (where the clause can be inserted)
+        table = self.table
+        mask = len(table) - 1
+        i = hash(new_clause) & mask
+        k = len(new_clause)
+        while table[i] >= 0:
+            start = self.offsets[table[i]]
+            if self.offsets[table[i] + 1] - start == k and tuple(self.literals[start:start + k]) == new_clause:
+                return i
+            i = (i + 1) & mask  # linear probing
+        return i
+
+    def grow_table(self):
+        self.table = array('q', [-1]) * (2 * len(self.table))
+        mask = len(self.table) - 1
+        for j in range(len(self)):
+            i = hash(self.clause(j)) & mask
+            while self.table[i] >= 0:
+                i = (i + 1) & mask
+            self.table[i] = j
+
+    def clause(self, j):
+        # returns the j-th clause as a tuple
+        return tuple(self.literals[self.offsets[j]:self.offsets[j + 1]])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        literals = self.literals
+        offsets = self.offsets
+        for j in range(len(offsets) - 1):
+            yield literals[offsets[j]:offsets[j + 1]]
 
-        key = str(new_clause)
-        if key not in self.existing_clauses_keys:
-            self.existing_clauses_keys.add(key)
-            self.clauses.append(new_clause)
+    def flat(self):
+        """Returns the underlying (literals, offsets) arrays without copying them."""
+        return self.literals, self.offsets
 
     def as_list(self):
-        return list(self.clauses)
+        return [list(c) for c in self]
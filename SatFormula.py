@@ -3,10 +3,26 @@
 import abc
 
 
+def sorted_keys(operands):
+    # keys of the operands of a commutative formula in the canonical (sorted) order
+    keys = [o.key() for o in operands]
+    try:
+        keys.sort()
+    except TypeError:  # mixed literal/constant/compound keys
+        keys.sort(key=str)
+    return tuple(keys)
+
+
 class SatFormula(metaclass=abc.ABCMeta):
+    # formula nodes are built by the million for wide products, thus, we use compact slotted objects
+    # with the operands stored as a tuple; the key and the hash are computed lazily and cached
+    __slots__ = ("sat_memory", "operands", "_key", "_hash")
+
     def __init__(self, sat_memory, operands):
         self.sat_memory = sat_memory
-        self.operands = operands
+        self.operands = tuple(operands)
+        self._key = None
+        self._hash = None
 
     def simplified_literal(self):
         """
@@ -18,9 +34,11 @@ class SatFormula(metaclass=abc.ABCMeta):
             which is either a Literal, or a Constant.
         """
         f = self.simplified_formula()
-        s = str(f)
-        if s in self.sat_memory.literals:
-            return self.sat_memory.literals[s]
+        if f.is_constant():
+            return f  # constants are not represented by SAT variables
+        key = f.key()
+        if key in self.sat_memory.literals:
+            return self.sat_memory.literals[key]
         else:
             return self.sat_memory.allocate_for(f)
         pass
@@ -34,6 +52,30 @@ class SatFormula(metaclass=abc.ABCMeta):
         """
         pass
 
+    def key(self):
+        """Returns a hashable key identifying the formula structurally (used for hash-consing in SatMemory):
+        a signed integer for a literal, "True"/"False" for a constant, and a tuple (operator, operand keys...)
+        for compound formulas (for And/Or, the operand keys are sorted, since the operators are commutative).
+        The key is computed once and cached in the node."""
+        key = self._key
+        if key is None:
+            key = self._key = self.canonical_key()
+        return key
+
+    @abc.abstractmethod
+    def canonical_key(self):
+        """Computes the key returned by key()."""
+        pass
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            h = self._hash = hash(self.key())
+        return h
+
+    def __eq__(self, other):
+        return isinstance(other, SatFormula) and self.key() == other.key()
+
     def is_constant(self):
         return False
 
@@ -50,15 +92,69 @@ class SatFormula(metaclass=abc.ABCMeta):
     def is_or(self):
         return False
 
-    @abc.abstractmethod
+    def is_xor(self):
+        return False
+
+    def is_majority(self):
+        return False
+
+    def is_gate(self):
+        # returns True for XorGate and MajorityGate, which are encoded in CNF directly (not via And/Or)
+        return self.is_xor() or self.is_majority()
+
     def evaluation(self):
         """Evaluates the formula and returns the result.
         If previously cached in sat_memory, returns the cached value.
-        If some free variable doesn't have a value, raises an Exception."""
+        If some free variable doesn't have a value, raises an Exception.
+
+        Sub-formulas are evaluated with an explicit stack (see evaluation_step()) instead of recursion,
+        since the depth of the circuit grows with the width of the product."""
+        stack = [[self, 0]]
+        value = None  # the value of the most recently evaluated formula
+        while stack:
+            frame = stack[-1]
+            done, x = frame[0].evaluation_step(frame[1], value)
+            frame[1] += 1
+            if done:
+                stack.pop()
+                value = x
+            else:
+                stack.append([x, 0])
+                value = None
+        return value
+
+    @abc.abstractmethod
+    def evaluation_step(self, step, value):
+        """Performs one step of the evaluation of this formula.
+
+        :param step: 0 for the first step, 1 for the second, etc.
+        :param value: the value of the operand requested by the previous step (None for the first step)
+        :return: (True, the value of this formula), if the evaluation is complete;
+            otherwise, (False, the operand to be evaluated before the next step)
+        """
+        pass
+
+    def __str__(self):
+        # serializing with an explicit stack instead of recursion (see str_parts())
+        parts = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+            else:
+                stack.extend(reversed(item.str_parts()))
+        return "".join(parts)
+
+    @abc.abstractmethod
+    def str_parts(self):
+        """Returns the serialized formula as a list of strings and operands (to be serialized in place)."""
         pass
 
 
 class And(SatFormula):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operands):
         #if len(operands) <= 2:
             super().__init__(sat_memory, operands)
@@ -68,18 +164,17 @@ class And(SatFormula):
     def simplified_formula(self):
         l1 = []
         for o in self.operands:
-            if o.is_and():
-                for child in o.operands:
-                    l1.append(child.simplified_literal())
-            elif o.is_constant():
-                if o.evaluation():
-                    continue  # skip True
-                else:
-                    return Constant(self.sat_memory, False)
-            else:
-                l1.append(o.simplified_literal())
+            children = o.operands if o.is_and() else (o,)
+            for child in children:
+                lit = child.simplified_literal()
+                if lit.is_constant():
+                    if lit.value:
+                        continue  # skip True
+                    else:
+                        return self.sat_memory.false
+                l1.append(lit)
         if len(l1) == 0:
-            return Constant(self.sat_memory, True)  # empty And is True (e.g., if all operands were True)
+            return self.sat_memory.true  # empty And is True (e.g., if all operands were True)
         if len(l1) == 1:
             return l1[0]
         f = And(self.sat_memory, l1)
@@ -88,31 +183,37 @@ class And(SatFormula):
     def is_and(self):
         return True
 
-    def __str__(self):
-        s = ""
-        for o in self.operands:
-            if len(s) == 0:
-                s += str(o)
-            else:
-                s += "&" + str(o)
-        return "{"+s+"}"
-
-    def evaluation(self):
-        s = str(self)
-        if s in self.sat_memory.values:
-            return self.sat_memory.values[s]
+    def canonical_key(self):
+        return ("&",) + sorted_keys(self.operands)
 
+    def str_parts(self):
+        parts = ["{"]
         for o in self.operands:
-            if not o.evaluation():  # at least one operand is False
-                self.sat_memory.values[s] = False
-                return False
+            if len(parts) > 1:
+                parts.append("&")
+            parts.append(o)
+        parts.append("}")
+        return parts
+
+    def evaluation_step(self, step, value):
+        values = self.sat_memory.values
+        if step == 0:
+            if self.key() in values:
+                return True, values[self.key()]
+        elif not value:  # at least one operand is False
+            values[self.key()] = False
+            return True, False
+        if step < len(self.operands):
+            return False, self.operands[step]
 
         # all operands are True
-        self.sat_memory.values[s] = True
-        return True
+        values[self.key()] = True
+        return True, True
 
 
 class Or(SatFormula):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operands):
         #if len(operands) <= 2:
             super().__init__(sat_memory, operands)
@@ -122,18 +223,17 @@ class Or(SatFormula):
     def simplified_formula(self):
         l1 = []
         for o in self.operands:
-            if o.is_or():
-                for child in o.operands:
-                    l1.append(child.simplified_literal())
-            elif o.is_constant():
-                if o.evaluation():
-                    return Constant(self.sat_memory, True)
-                else:
-                    continue  # skip False
-            else:
-                l1.append(o.simplified_literal())
+            children = o.operands if o.is_or() else (o,)
+            for child in children:
+                lit = child.simplified_literal()
+                if lit.is_constant():
+                    if lit.value:
+                        return self.sat_memory.true
+                    else:
+                        continue  # skip False
+                l1.append(lit)
         if len(l1) == 0:
-            return Constant(self.sat_memory, False)  # empty Or is False (e.g., if all operands were False)
+            return self.sat_memory.false  # empty Or is False (e.g., if all operands were False)
         if len(l1) == 1:
             return l1[0]
         f = Or(self.sat_memory, l1)
@@ -142,31 +242,37 @@ class Or(SatFormula):
     def is_or(self):
         return True
 
-    def __str__(self):
-        s = ""
-        for o in self.operands:
-            if len(s) == 0:
-                s += str(o)
-            else:
-                s += "|" + str(o)
-        return "["+s+"]"
-
-    def evaluation(self):
-        s = str(self)
-        if s in self.sat_memory.values:
-            return self.sat_memory.values[s]
+    def canonical_key(self):
+        return ("|",) + sorted_keys(self.operands)
 
+    def str_parts(self):
+        parts = ["["]
         for o in self.operands:
-            if o.evaluation():  # at least one operand is True
-                self.sat_memory.values[s] = True
-                return True
+            if len(parts) > 1:
+                parts.append("|")
+            parts.append(o)
+        parts.append("]")
+        return parts
+
+    def evaluation_step(self, step, value):
+        values = self.sat_memory.values
+        if step == 0:
+            if self.key() in values:
+                return True, values[self.key()]
+        elif value:  # at least one operand is True
+            values[self.key()] = True
+            return True, True
+        if step < len(self.operands):
+            return False, self.operands[step]
 
         # all operands are False
-        self.sat_memory.values[s] = False
-        return False
+        values[self.key()] = False
+        return True, False
 
 
 class Xor(Or):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operands):
         if len(operands) < 2:
             raise Exception("Xor takes at least 2 operands but " + str(len(operands)) + " given.")
@@ -185,6 +291,8 @@ class Xor(Or):
 
 
 class Majority(Or):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operands):
         if len(operands) != 3:
             raise Exception("Majority takes exactly 3 operands but " + str(len(operands)) + " given.")
@@ -193,7 +301,166 @@ class Majority(Or):
             And(sat_memory, [operands[2], Xor(sat_memory, [operands[0], operands[1]])])])
 
 
+class XorGate(SatFormula):
+    # XOR2/XOR3 as a single node, which is encoded in CNF directly (4 or 8 clauses, without auxiliary variables),
+    # unlike Xor, which is desugared into And/Or/Not;
+    # the canonical form (see simplified_literal()) has only positive operand literals, since
+    # -a^b^c = -(a^b^c)
+    __slots__ = ()
+
+    def __init__(self, sat_memory, operands):
+        if len(operands) < 2 or len(operands) > 3:
+            raise Exception("XorGate takes 2 or 3 operands but " + str(len(operands)) + " given.")
+        super().__init__(sat_memory, operands)
+
+    def canonical_form(self):
+        """Returns (inverted, f), where f is a constant, a literal, or an XorGate of positive literals,
+        and the XOR of the operands is equal to f (if inverted is False) or -f (if inverted is True)."""
+        inverted = False
+        literals = {}  # variable index -> positive literal, for variables occurring an odd number of times
+        for o in self.operands:
+            lit = o.simplified_literal()
+            if lit.is_constant():
+                inverted ^= lit.value
+                continue
+            if lit.is_negation():
+                inverted = not inverted
+                lit = lit.inverse()
+            if lit.index in literals:
+                del literals[lit.index]  # x^x = False
+            else:
+                literals[lit.index] = lit
+        if len(literals) == 0:
+            return False, self.sat_memory.constant(inverted)
+        if len(literals) == 1:
+            return inverted, next(iter(literals.values()))
+        return inverted, XorGate(self.sat_memory, sorted(literals.values(), key=lambda lit: lit.index))
+
+    def simplified_formula(self):
+        inverted, f = self.canonical_form()
+        if not inverted:
+            return f
+        if not f.is_gate():
+            return f.inverse()
+        # the inversion is pushed into the first operand
+        return XorGate(self.sat_memory, [f.operands[0].inverse()] + list(f.operands[1:]))
+
+    def simplified_literal(self):
+        # both XOR polarities share the same variable
+        inverted, f = self.canonical_form()
+        if f.is_gate():
+            key = f.key()
+            f = self.sat_memory.literals[key] if key in self.sat_memory.literals else self.sat_memory.allocate_for(f)
+        return f.inverse() if inverted else f
+
+    def negated(self):
+        return XorGate(self.sat_memory, [Not(self.sat_memory, self.operands[0])] + list(self.operands[1:]))
+
+    def is_xor(self):
+        return True
+
+    def canonical_key(self):
+        return ("^",) + sorted_keys(self.operands)
+
+    def str_parts(self):
+        parts = ["("]
+        for o in self.operands:
+            if len(parts) > 1:
+                parts.append("^")
+            parts.append(o)
+        parts.append(")")
+        return parts
+
+    def evaluation_step(self, step, value):
+        values = self.sat_memory.values
+        if step == 0:
+            if self.key() in values:
+                return True, values[self.key()]
+        if step < len(self.operands):
+            return False, self.operands[step]
+
+        # the value of the last operand has been computed (the previous ones are cached in values)
+        value = (value + sum(values[o.key()] for o in self.operands[:-1])) % 2 == 1
+        values[self.key()] = value
+        return True, value
+
+
+class MajorityGate(SatFormula):
+    # MAJ3 (the carry of a full adder) as a single node, which is encoded in CNF directly (6 clauses,
+    # without auxiliary variables), unlike Majority, which is desugared into And/Or/Not;
+    # the canonical form (see simplified_literal()) has at most one negative operand literal, since
+    # maj(-a,-b,-c) = -maj(a,b,c)
+    __slots__ = ()
+
+    def __init__(self, sat_memory, operands):
+        if len(operands) != 3:
+            raise Exception("MajorityGate takes exactly 3 operands but " + str(len(operands)) + " given.")
+        super().__init__(sat_memory, operands)
+
+    def canonical_form(self):
+        """Returns (inverted, f), where f is a constant, a literal, an And/Or formula, or a MajorityGate
+        with at most one negative operand literal, and maj(operands) is equal to f (if inverted is False)
+        or -f (if inverted is True)."""
+        operands = [o.simplified_literal() for o in self.operands]
+        for i, j, k in ((0, 1, 2), (0, 2, 1), (1, 2, 0)):
+            if operands[i].key() == operands[j].key():
+                return False, operands[i]  # maj(a,a,c) = a
+            if operands[i].inverse().key() == operands[j].key():
+                return False, operands[k]  # maj(a,-a,c) = c
+        # here, there is at most one constant
+        constants = [o for o in operands if o.is_constant()]
+        literals = [o for o in operands if not o.is_constant()]
+        if len(constants) == 1:
+            if constants[0].value:
+                return False, Or(self.sat_memory, literals).simplified_formula()  # maj(a,b,True) = a|b
+            return False, And(self.sat_memory, literals).simplified_formula()  # maj(a,b,False) = a&b
+        if sum(1 for lit in literals if lit.is_negation()) >= 2:
+            return True, MajorityGate(self.sat_memory, [lit.inverse() for lit in literals])
+        return False, MajorityGate(self.sat_memory, literals)
+
+    def simplified_formula(self):
+        inverted, f = self.canonical_form()
+        if not inverted:
+            return f
+        return MajorityGate(self.sat_memory, [o.inverse() for o in f.operands])
+
+    def simplified_literal(self):
+        # both majority polarities share the same variable
+        inverted, f = self.canonical_form()
+        if not f.is_literal() and not f.is_constant():
+            key = f.key()
+            f = self.sat_memory.literals[key] if key in self.sat_memory.literals else self.sat_memory.allocate_for(f)
+        return f.inverse() if inverted else f
+
+    def negated(self):
+        return MajorityGate(self.sat_memory, [Not(self.sat_memory, o) for o in self.operands])
+
+    def is_majority(self):
+        return True
+
+    def canonical_key(self):
+        return ("maj",) + sorted_keys(self.operands)
+
+    def str_parts(self):
+        return ["maj(", self.operands[0], ",", self.operands[1], ",", self.operands[2], ")"]
+
+    def evaluation_step(self, step, value):
+        values = self.sat_memory.values
+        if step == 0:
+            if self.key() in values:
+                return True, values[self.key()]
+        if step < len(self.operands):
+            return False, self.operands[step]
+
+        # the value of the last operand has been computed (the previous ones are cached in values)
+        n_true = value + sum(values[o.key()] for o in self.operands[:-1])
+        values[self.key()] = n_true >= 2
+        return True, n_true >= 2
+
+
 class Implication(Or):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operands):
         if len(operands) != 2:
             raise Exception("Implication takes exactly 2 operands but " + str(len(operands)) + " given.")
@@ -204,6 +471,8 @@ class Implication(Or):
 
 
 class Equivalence(And):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operands):
         if len(operands) != 2:
             raise Exception("Equivalence takes exactly 2 operands but " + str(len(operands)) + " given.")
@@ -214,9 +483,14 @@ class Equivalence(And):
 
 
 class Constant(SatFormula):
+    # there is a single shared instance for each value in each SatMemory (sat_memory.true and sat_memory.false);
+    # use sat_memory.constant(value) instead of creating new instances
+    __slots__ = ("value",)
+
     def __init__(self, sat_memory, value):
         super().__init__(sat_memory, [])
         self.value = value
+        self._key = str(value)
 
     def simplified_formula(self):
         return self
@@ -227,31 +501,47 @@ class Constant(SatFormula):
     def is_constant(self):
         return True
 
+    def canonical_key(self):
+        return str(self.value)
+
     def __str__(self):
         return str(self.value)
 
+    def str_parts(self):
+        return [str(self.value)]
+
     def inverse(self):
-        return Constant(self.sat_memory, not self.value)
+        return self.sat_memory.constant(not self.value)
 
     def evaluation(self):
         return self.value
 
+    def evaluation_step(self, step, value):
+        return True, self.value
+
 
 class Literal(SatFormula):
-    def __init__(self, sat_memory, negation_flag, var_name, reduced_formula=None):
+    # literals are interned in SatMemory.literals (one instance per polarity of each variable);
+    # use sat_memory.allocate() or sat_memory.allocate_for() instead of creating new instances
+    __slots__ = ("negation_flag", "index")
+
+    def __init__(self, sat_memory, negation_flag, index, reduced_formula=None):
+        # index - the (positive) index of the SAT variable, e.g., 5 for x5 and -x5
         # reduced_formula - if set, must correspond to the negation_flag
         super().__init__(sat_memory, [])
         self.negation_flag = negation_flag
-        self.var_name = var_name
+        self.index = index
+        self._key = -index if negation_flag else index
         if reduced_formula is not None:
-            sat_memory.reduced_formulas[str(self)] = reduced_formula
+            sat_memory.reduced_formulas[self._key] = reduced_formula
             # TODO: check for different formulas
 
+    @property
+    def var_name(self):
+        return "x" + str(self.index)
+
     def __int__(self):
-        if self.negation_flag:
-            return -int(self.var_name[1:])
-        else:
-            return int(self.var_name[1:])
+        return self._key
 
     def simplified_formula(self):
         return self
@@ -260,7 +550,7 @@ class Literal(SatFormula):
         return self
 
     def inverse(self):
-        return Literal(self.sat_memory, not self.negation_flag, self.var_name)
+        return self.sat_memory.literals[-self._key]
 
     def is_literal(self):
         return True
@@ -268,62 +558,70 @@ class Literal(SatFormula):
     def is_negation(self):
         return self.negation_flag
 
+    def canonical_key(self):
+        return -self.index if self.negation_flag else self.index
+
     def __str__(self):
         if self.negation_flag:
             return "-" + self.var_name
         else:
             return self.var_name
 
-    def evaluation(self):
-        s = str(self)
-
-        if s in self.sat_memory.values:
-            return self.sat_memory.values[s]
-
-        if s in self.sat_memory.reduced_formulas:
-            # via reduced_formula:
-            reduced_formula = self.sat_memory.reduced_formulas[s]
-            value = reduced_formula.evaluation()
-            self.sat_memory.values[s] = value
-            return value
+    def str_parts(self):
+        return [str(self)]
 
-        if self.negation_flag:
-            if self.var_name in self.sat_memory.values:
-                value = not self.sat_memory.values[self.var_name]
-            else:
-                if self.var_name in self.sat_memory.reduced_formulas:
-                    value = not self.sat_memory.reduced_formulas[self.var_name].evaluation()
-                else:
-                    raise Exception(self.var_name + " does not have a value and does not represent a reduced sub-formula")
-        else:
-            if "-"+self.var_name in self.sat_memory.values:
-                value = not self.sat_memory.values["-" + self.var_name]
+    def evaluation(self):
+        key = self._key
+        if key in self.sat_memory.values:
+            return self.sat_memory.values[key]
+        return super().evaluation()
+
+    def evaluation_step(self, step, value):
+        key = self._key
+        values = self.sat_memory.values
+        reduced_formulas = self.sat_memory.reduced_formulas
+
+        if step == 0:
+            if key in values:
+                return True, values[key]
+            if key in reduced_formulas:
+                # via reduced_formula:
+                return False, reduced_formulas[key]
+            # via the opposite literal:
+            if -key in values:
+                value = not values[-key]
+            elif -key in reduced_formulas:
+                return False, reduced_formulas[-key]
             else:
-                if "-"+self.var_name in self.sat_memory.reduced_formulas:
-                    value = not self.sat_memory.reduced_formulas["-" + self.var_name].evaluation()
-                else:
-                    raise Exception(self.var_name + " does not have a value and does not represent a reduced sub-formula")
+                raise Exception(self.var_name + " does not have a value and does not represent a reduced sub-formula")
+        elif key not in reduced_formulas:
+            value = not value  # the value of the opposite literal has been computed
 
-        self.sat_memory.values[s] = value
-        return value
+        values[key] = value
+        return True, value
 
 
 class Not(SatFormula):
+    __slots__ = ()
+
     def __init__(self, sat_memory, operand):
         super().__init__(sat_memory, [operand])
 
     def simplified_formula(self):
         o = self.operands[0]
         if o.is_constant():
-            return Constant(self.sat_memory, not o.evaluation())
+            return o.inverse()
 
         if o.is_literal():
-            return Literal(self.sat_memory, not o.is_negation(), o.var_name)
+            return o.inverse()
 
         if o.is_negation():
             oo = o.operands[0]
             return oo.simplified_formula()
 
+        if o.is_gate():  # the negation is pushed into the operands, e.g., -(a^b) = -a^b
+            return o.negated().simplified_formula()
+
         # De Morgan's laws:
         if o.is_and():  # -(O1 & O2) = -O1 | -O2
             l1 = []
@@ -343,18 +641,22 @@ class Not(SatFormula):
     def is_negation(self):
         return True
 
-    def __str__(self):
+    def canonical_key(self):
+        return ("-", self.operands[0].key())
+
+    def str_parts(self):
         if self.operands[0].is_literal() or self.operands[0].is_constant():
-            return "-"+str(self.operands[0])
+            return ["-", self.operands[0]]
         else:
-            return "-(" + str(self.operands[0]) + ")"
-
-    def evaluation(self):
-        s = str(self)
-        if s in self.sat_memory.values:
-            return self.sat_memory.values[s]
-
-        o = self.operands[0]
-        value = not o.evaluation()
-        self.sat_memory.values[s] = value
-        return value
+            return ["-(", self.operands[0], ")"]
+
+    def evaluation_step(self, step, value):
+        values = self.sat_memory.values
+        if step == 0:
+            if self.key() in values:
+                return True, values[self.key()]
+            return False, self.operands[0]
+
+        value = not value
+        values[self.key()] = value
+        return True, value
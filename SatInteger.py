@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 
+import math
+
 from SatFormula import *
 import traceback
 
 
 class SatInteger:
+    # the adder architectures supported by sum_with() (and, hence, by negation(), sum_of() and product_with())
+    ADDERS = ["ripple", "kogge_stone", "brent_kung", "sklansky", "carry_select"]
+    # the default maximal length of the shorter operand multiplied by the schoolbook method (see product_with())
+    # (up to about 8 bits, the array multiplier needs fewer gates than the Karatsuba recombination)
+    SCHOOLBOOK_BITS = 8
+    # the multipliers for the operands up to schoolbook_bits (see product_with())
+    BASE_MULTIPLIERS = ["array", "wallace", "dadda"]
+    # the multiplication algorithms supported by product_with()
+    MULTIPLIERS = ["karatsuba", "toom3"]
+    # the default minimal length of the shorter operand multiplied by Toom-3 (see product_with())
+    TOOM3_BITS = 64
+
     def __init__(self, sat_memory, literals):
         """ Initializes an integer with bits corresponding to literals.
         for positive literal x_i, bit_i = 1 means x_i = True;
@@ -15,11 +29,11 @@ class SatInteger:
         """
         self.sat_memory = sat_memory
         self.n_bits = len(literals)
-        self.literals = list(map(lambda x: self.sat_memory.literal(str(x)), literals))
+        self.literals = list(map(lambda x: self.sat_memory.literal(x), literals))
 
     def clipped(self, n_bits):
         if self.n_bits <= n_bits:
-            zero = Constant(self.sat_memory, False)
+            zero = self.sat_memory.false
             return SatInteger(self.sat_memory, self.literals + [zero] * (n_bits - self.n_bits))
         else:
             return SatInteger(self.sat_memory, self.literals[:n_bits])
@@ -28,7 +42,7 @@ class SatInteger:
         return SatInteger(self.sat_memory, self.literals + literals)
 
     def left_shifted(self, k_bits):
-        zero = Constant(self.sat_memory, False)
+        zero = self.sat_memory.false
         return SatInteger(self.sat_memory, [zero] * k_bits + self.literals)
 
     def right_shifted(self, k_bits):
@@ -42,9 +56,12 @@ class SatInteger:
             result.append(And(self.sat_memory, [self.literals[i], other.literals[i]]).simplified_literal())
         return SatInteger(self.sat_memory, result)
 
-    def negation(self):
+    def negation(self, adder="ripple"):
         # inverse bits
         inverse_literals = list(map(lambda lit: lit.inverse(), self.literals))
+        if adder != "ripple":
+            one = SatInteger.constant(self.sat_memory, 1, self.n_bits)
+            return SatInteger(self.sat_memory, inverse_literals).sum_with(one, adder)
 
         # result = inverse + 1
 
@@ -60,17 +77,29 @@ class SatInteger:
         for i in range(1, self.n_bits):
             # computing: carry[i],result[i] <- inverse_literals[i] + carry[i-1]
             carry_formula = And(self.sat_memory, [inverse_literals[i], carry[i - 1]])
-            result_formula = Xor(self.sat_memory, [inverse_literals[i], carry[i - 1]])
+            result_formula = XorGate(self.sat_memory, [inverse_literals[i], carry[i - 1]])
 
             result.append(result_formula.simplified_literal())
             if i < self.n_bits - 1:  # the next carry bit, ignoring the last one
                 carry.append(carry_formula.simplified_literal())
         return SatInteger(self.sat_memory, result)
 
-    def sum_with(self, other):
+    def sum_with(self, other, adder="ripple"):
+        """Returns self+other (modulo 2^n_bits).
+
+        :param other: a SatInteger with the same number of bits
+        :param adder: the adder architecture (one of ADDERS): "ripple" (the default) has the carry chain linear
+            in the number of bits; the parallel-prefix adders "kogge_stone", "brent_kung" and "sklansky" compute
+            the carries with logarithmic depth (with different numbers of gates), and "carry_select" computes
+            each block of about sqrt(n_bits) bits for both carry-in values
+        """
         if self.n_bits != other.n_bits:
             raise Exception("Could not sum numbers with different number of bits (" +
                             str(self.n_bits) + " and " + str(other.n_bits) + ")")
+        if adder == "carry_select":
+            return self.carry_select_sum_with(other)
+        if adder != "ripple":
+            return self.prefix_sum_with(other, adder)
         # carry   = ....c1,c0
         # self    = ....i2,i1,i0 +
         # other   = ....j2,j1,j0
@@ -78,19 +107,17 @@ class SatInteger:
         # result  = ....r2,r1,r0
 
         carry = [And(self.sat_memory, [self.literals[0], other.literals[0]]).simplified_literal()]
-        r0 = Xor(self.sat_memory, [self.literals[0], other.literals[0]])  # half adder
+        r0 = XorGate(self.sat_memory, [self.literals[0], other.literals[0]])  # half adder
         result = [r0.simplified_literal()]
 
         for i in range(1, self.n_bits):
             # implementing full adder
-            result_formula = Xor(self.sat_memory, [
+            result_formula = XorGate(self.sat_memory, [
                 self.literals[i],
-                Xor(self.sat_memory, [
-                    other.literals[i],
-                    carry[i - 1]])
-            ])
+                other.literals[i],
+                carry[i - 1]])
 
-            carry_formula = Majority(self.sat_memory, [
+            carry_formula = MajorityGate(self.sat_memory, [
                 self.literals[i],
                 other.literals[i],
                 carry[i - 1]])
@@ -102,55 +129,195 @@ class SatInteger:
 
         return SatInteger(self.sat_memory, result)
 
-    def product_with(self, other, optimize = True):
+    def difference_with(self, other, adder="ripple"):
+        """Returns self-other (modulo 2^n_bits) computed by a borrow chain (instead of self+(-other), which would
+        need an extra increment chain for the negation).
+
+        :param other: a SatInteger with the same number of bits
+        :param adder: the adder architecture (see sum_with()); for non-ripple adders, self-other is computed
+            as ~(~self+other)
+        """
         if self.n_bits != other.n_bits:
-            raise Exception("Could not multiply numbers with different number of bits (" +
+            raise Exception("Could not subtract numbers with different number of bits (" +
                             str(self.n_bits) + " and " + str(other.n_bits) + ")")
-        if self.n_bits == 1:
-            product_lo = And(self.sat_memory, [self.literals[0], other.literals[0]]).simplified_literal()
-            product_hi = Constant(self.sat_memory, False)
-            return SatInteger(self.sat_memory, [product_lo, product_hi])
-
-        if self.n_bits % 2 == 1:
-            raise Exception("Currently we support only 2^k bits for Karatsuba multiplication but "
-                            + str(self) + " has " + str(self.n_bits) + " bits")
-            
-        if optimize and self.n_bits==2:
-            # [1] [0]|
-            # =======|
-            # z11 z01| other[1]
-            # z10 z00| other[0]
-                        
-            z00 = And(self.sat_memory, [self.literals[0], other.literals[0]])                        
-            z01 = And(self.sat_memory, [self.literals[0], other.literals[1]])                        
-            z10 = And(self.sat_memory, [self.literals[1], other.literals[0]])                        
-            z11 = And(self.sat_memory, [self.literals[1], other.literals[1]])   
-            
-            a = z00.simplified_literal()                     
-            b = Xor(self.sat_memory, [z10, z01]).simplified_literal()  # half adder
-            carry1 = And(self.sat_memory, [z10, z01]).simplified_literal()
-            c = Xor(self.sat_memory, [z11, carry1]).simplified_literal()  # half adder
-            carry2 = And(self.sat_memory, [z11, carry1]).simplified_literal()
-            d = carry2
-            result = SatInteger(self.sat_memory, [a, b, c, d])
-            print("result is "+str(result))
-            return result
-            
-
-        half_bits = self.n_bits // 2
-        zero = Constant(self.sat_memory, False)
+        if adder != "ripple":
+            inverse = SatInteger(self.sat_memory, [lit.inverse() for lit in self.literals])
+            inverse_sum = inverse.sum_with(other, adder)
+            return SatInteger(self.sat_memory, [lit.inverse() for lit in inverse_sum.literals])
+        # borrow  = ....b1,b0
+        # self    = ....i2,i1,i0 -
+        # other   = ....j2,j1,j0
+        # ----------------------
+        # result  = ....r2,r1,r0
+
+        borrow = [And(self.sat_memory, [self.literals[0].inverse(), other.literals[0]]).simplified_literal()]
+        result = [XorGate(self.sat_memory, [self.literals[0], other.literals[0]]).simplified_literal()]
+        for i in range(1, self.n_bits):
+            # implementing full subtractor
+            result_formula = XorGate(self.sat_memory, [self.literals[i], other.literals[i], borrow[i - 1]])
+            borrow_formula = MajorityGate(self.sat_memory, [self.literals[i].inverse(), other.literals[i],
+                                                            borrow[i - 1]])
+            result.append(result_formula.simplified_literal())
+            if i < self.n_bits - 1:  # the next borrow bit, ignoring the last one
+                borrow.append(borrow_formula.simplified_literal())
+        return SatInteger(self.sat_memory, result)
+
+    def compare_ge(self, other):
+        """Returns the literal, which is True iff self >= other (as unsigned integers).
+
+        Only the borrow chain of self-other is built (without the difference bits): self >= other iff
+        there is no borrow out of the most significant bit.
+
+        :param other: a SatInteger with the same number of bits
+        """
+        if self.n_bits != other.n_bits:
+            raise Exception("Could not compare numbers with different number of bits (" +
+                            str(self.n_bits) + " and " + str(other.n_bits) + ")")
+        borrow = And(self.sat_memory, [self.literals[0].inverse(), other.literals[0]]).simplified_literal()
+        for i in range(1, self.n_bits):
+            borrow = MajorityGate(self.sat_memory, [self.literals[i].inverse(), other.literals[i],
+                                                    borrow]).simplified_literal()
+        return borrow.inverse()
+
+    def prefix_sum_with(self, other, adder):
+        # the generate (g) and propagate (p) bits are combined into the carries by the given prefix network;
+        # the i-th group (G[i], P[i]) corresponds to the bits j..i for some j; P[i] is None, if j=0,
+        # i.e., G[i] is already the carry out of the bit i
+        mem = self.sat_memory
+        n = self.n_bits
+        p = [XorGate(mem, [self.literals[i], other.literals[i]]).simplified_literal() for i in range(n)]
+        G = [And(mem, [self.literals[i], other.literals[i]]).simplified_literal() for i in range(n)]
+        P = [None] + p[1:]
+
+        def combine(i, j):
+            # (G[i], P[i]) := (G[i], P[i]) o (G[j], P[j]) for the adjacent groups j+1..i and ...j
+            G[i] = Or(mem, [G[i], And(mem, [P[i], G[j]])]).simplified_literal()
+            P[i] = None if P[j] is None else And(mem, [P[i], P[j]]).simplified_literal()
+
+        if adder == "kogge_stone":
+            # each level combines each group with the group d positions lower
+            d = 1
+            while d < n:
+                for i in reversed(range(d, n)):  # from the top, since the groups i-d must be from the previous level
+                    if P[i] is not None:
+                        combine(i, i - d)
+                d *= 2
+        elif adder == "sklansky":
+            # the upper half of each 2d-block is combined with the last group of the lower half
+            d = 1
+            while d < n:
+                for i in range(n):
+                    if (i // d) % 2 == 1:
+                        combine(i, (i // d) * d - 1)
+                d *= 2
+        elif adder == "brent_kung":
+            # the up-sweep combines the groups of 2d bits ending at 2d-1, 4d-1, ...;
+            # the down-sweep completes the remaining groups in between
+            d = 1
+            while d < n:
+                for i in range(2 * d - 1, n, 2 * d):
+                    combine(i, i - d)
+                d *= 2
+            d //= 2
+            while d >= 1:
+                for i in range(3 * d - 1, n, 2 * d):
+                    combine(i, i - d)
+                d //= 2
+        else:
+            raise Exception("Unknown adder " + str(adder) + "; expected one of: " + ", ".join(SatInteger.ADDERS))
+
+        result = [p[0]] + [XorGate(mem, [p[i], G[i - 1]]).simplified_literal() for i in range(1, n)]
+        return SatInteger(mem, result)
+
+    def carry_select_sum_with(self, other):
+        mem = self.sat_memory
+        n = self.n_bits
+        block_bits = max(1, math.isqrt(n))
+
+        def ripple(lo, hi, carry):
+            # returns (the sum bits lo..hi-1, the carry out) for the given carry in
+            sum_bits = []
+            for i in range(lo, hi):
+                operands = [self.literals[i], other.literals[i], carry]
+                sum_bits.append(XorGate(mem, operands).simplified_literal())
+                carry = MajorityGate(mem, operands).simplified_literal()
+            return sum_bits, carry
+
+        result, carry = ripple(0, block_bits, mem.false)
+        for lo in range(block_bits, n, block_bits):
+            hi = min(lo + block_bits, n)
+            sum0, carry0 = ripple(lo, hi, mem.false)
+            sum1, carry1 = ripple(lo, hi, mem.true)
+            for s0, s1 in zip(sum0, sum1):  # the multiplexer selecting s1 (if carry) or s0
+                result.append(Or(mem, [And(mem, [carry, s1]), And(mem, [carry.inverse(), s0])]).simplified_literal())
+            if hi < n:
+                carry = Or(mem, [carry0, And(mem, [carry, carry1])]).simplified_literal()
+        return SatInteger(mem, result)
+
+    def product_with(self, other, optimize=True, adder="ripple", schoolbook_bits=SCHOOLBOOK_BITS,
+                     multiplier="karatsuba", toom3_bits=TOOM3_BITS, base_multiplier="array"):
+        """Returns the (self.n_bits + other.n_bits)-bit product self*other (of unsigned integers).
+
+        The product is computed by the Karatsuba algorithm: the longer operand is split at half_bits (rounded up);
+        if the shorter operand does not exceed half_bits, the longer one is split alone (the two partial
+        products are added), otherwise, both operands are split, and three products of about half_bits bits
+        are computed recursively.
+
+        :param other: a SatInteger of any number of bits
+        :param optimize: whether to multiply the operands by the schoolbook method, when the shorter of them
+            has at most schoolbook_bits bits (otherwise, Karatsuba recursion goes down to 1-bit operands)
+        :param adder: the adder architecture (see sum_with())
+        :param schoolbook_bits: see optimize
+        :param multiplier: "karatsuba" or "toom3" (see toom3_product_with()), which is used, when the shorter
+            operand has more than toom3_bits bits (and more than two thirds of the longer one); shorter operands
+            (including the recursive ones) are multiplied by Karatsuba
+        :param toom3_bits: see multiplier
+        :param base_multiplier: how the operands up to schoolbook_bits are multiplied (see
+            schoolbook_product_with()); e.g., schoolbook_bits=32 and base_multiplier="dadda" give the hybrid
+            circuit with Karatsuba above 32 bits and Dadda tree multipliers below
+        """
+        if multiplier not in SatInteger.MULTIPLIERS:
+            raise Exception("Unknown multiplier " + str(multiplier) + "; expected one of: " +
+                            ", ".join(SatInteger.MULTIPLIERS))
+        if self.n_bits < other.n_bits:
+            return other.product_with(self, optimize, adder, schoolbook_bits, multiplier, toom3_bits,
+                                      base_multiplier)
+
+        def product(a, b):
+            return a.product_with(b, optimize, adder, schoolbook_bits, multiplier, toom3_bits, base_multiplier)
+
+        n_bits = self.n_bits + other.n_bits
+        if other.n_bits == 1:
+            # a 1-bit operand selects either the other operand or 0
+            result = self.and_with(SatInteger(self.sat_memory, [other.literals[0]] * self.n_bits))
+            return result.clipped(n_bits)
+        if optimize and other.n_bits <= schoolbook_bits:
+            return self.schoolbook_product_with(other, adder, base_multiplier)
+        # Toom-3 needs three pieces of k bits in both operands, and the evaluations (of up to k+3 bits) must be
+        # shorter than the operands
+        k = (self.n_bits + 2) // 3
+        if multiplier == "toom3" and other.n_bits > max(toom3_bits, 2 * k, k + 3):
+            return self.toom3_product_with(other, product, adder)
+
+        half_bits = (self.n_bits + 1) // 2
         u0 = SatInteger(self.sat_memory, self.literals[0:half_bits])
         u1 = SatInteger(self.sat_memory, self.literals[half_bits:self.n_bits])
-        u0z = SatInteger(self.sat_memory, self.literals[0:half_bits] + [zero])
-        u1z = SatInteger(self.sat_memory, self.literals[half_bits:self.n_bits] + [zero])
+        if other.n_bits <= half_bits:
+            # other is too short to be split: self*other = u0*other + (u1*other) << half_bits
+            u0v = product(u0, other)
+            u1v = product(u1, other)
+            return SatInteger.sum_of(self.sat_memory, [u0v, u1v.left_shifted(half_bits)], n_bits, adder)
 
         v0 = SatInteger(self.sat_memory, other.literals[0:half_bits])
         v1 = SatInteger(self.sat_memory, other.literals[half_bits:other.n_bits])
-        v0z = SatInteger(self.sat_memory, other.literals[0:half_bits] + [zero])
-        v1z = SatInteger(self.sat_memory, other.literals[half_bits:other.n_bits] + [zero])
+        # (half_bits+1)-bit operands for the differences (u1 and v1 may be shorter than half_bits)
+        u0z = u0.clipped(half_bits + 1)
+        u1z = u1.clipped(half_bits + 1)
+        v0z = v0.clipped(half_bits + 1)
+        v1z = v1.clipped(half_bits + 1)
 
-        u1_minus_u0 = u1z.sum_with(u0z.negation())
-        v0_minus_v1 = v0z.sum_with(v1z.negation())
+        u1_minus_u0 = u1z.difference_with(u0z, adder)
+        v0_minus_v1 = v0z.difference_with(v1z, adder)
 
         # remove the sign/overflow bit
         sign1 = u1_minus_u0.literals[-1]
@@ -158,35 +325,241 @@ class SatInteger:
         u1_minus_u0 = u1_minus_u0.clipped(u1_minus_u0.n_bits - 1)
         v0_minus_v1 = v0_minus_v1.clipped(v0_minus_v1.n_bits - 1)
 
-        # (sign(arg1) xor sign(arg2) and (arg1 != 0) and (arg2 != 0)
-        xor_signs = And(self.sat_memory,
-                        [Xor(self.sat_memory, [sign1, sign2]),
-                         Or(self.sat_memory, u1_minus_u0.literals),
-                         Or(self.sat_memory, v0_minus_v1.literals)])
-        xor_signs = xor_signs.simplified_literal()
+        u0v0 = product(u0, v0)
+        u1v1 = product(u1, v1)
+        mixed = product(u1_minus_u0, v0_minus_v1)
+
+        # The result is u1v1|u0v0 + (u0v0 + u1v1 + (u1-u0)(v0-v1)) << half_bits (mod 2^n_bits).
+        # Since u1-u0 = A - sign1*2^h and v0-v1 = B - sign2*2^h (where A and B are the unsigned h-bit numbers
+        # u1_minus_u0 and v0_minus_v1, and h=half_bits), we have
+        #   (u1-u0)(v0-v1) << h = AB << h - (A&sign2) << 2h - (B&sign1) << 2h + (sign1&sign2) << 3h,
+        # where -X << 2h = (~X + 1 - 2^h) << 2h for the bitwise inverse ~X of the h-bit number X.
+        # All the addends are accumulated (mod 2^n_bits) by carry-save adders and a single carry-propagate adder.
+        a_sign2 = u1_minus_u0.and_with(SatInteger(self.sat_memory, [sign2] * half_bits))
+        b_sign1 = v0_minus_v1.and_with(SatInteger(self.sat_memory, [sign1] * half_bits))
+        inverted_a_sign2 = SatInteger(self.sat_memory, [lit.inverse() for lit in a_sign2.literals])
+        inverted_b_sign1 = SatInteger(self.sat_memory, [lit.inverse() for lit in b_sign1.literals])
+        sign1_sign2 = And(self.sat_memory, [sign1, sign2]).simplified_literal()
+        # the constant parts of both -X << 2h
+        constant = (2 * ((1 << 2 * half_bits) - (1 << 3 * half_bits))) % (1 << n_bits)
+
+        result = SatInteger.sum_of(self.sat_memory, [
+            SatInteger(self.sat_memory, u0v0.literals + u1v1.literals),  # u1v1|u0v0 (u0v0 has 2h bits)
+            u0v0.left_shifted(half_bits),
+            u1v1.left_shifted(half_bits),
+            mixed.left_shifted(half_bits),
+            inverted_a_sign2.left_shifted(2 * half_bits),
+            inverted_b_sign1.left_shifted(2 * half_bits),
+            SatInteger(self.sat_memory, [sign1_sign2]).left_shifted(3 * half_bits),
+            SatInteger.constant(self.sat_memory, constant, n_bits)
+        ], n_bits, adder)
 
-        u0v0 = u0.product_with(v0, optimize)
-        u1v1 = u1.product_with(v1, optimize)
-        mixed = u1_minus_u0.product_with(v0_minus_v1, optimize)
+        return result
 
-        # important: we add shifted product of ...11111 * u1_minus_u0, which is the same as shifted -u1_minus_u0
-        mixed = mixed.sum_with(u1_minus_u0.negation().and_with(
-                SatInteger(self.sat_memory, [sign2] * half_bits))
-                .left_shifted(half_bits))
-        mixed = mixed.sum_with(v0_minus_v1.negation().and_with(
-                SatInteger(self.sat_memory, [sign1] * half_bits))
-                .left_shifted(half_bits))
+    def toom3_product_with(self, other, product, adder="ripple"):
+        """Returns the (self.n_bits + other.n_bits)-bit product self*other computed by the Toom-3 algorithm.
 
-        result = SatInteger(self.sat_memory, u0v0.literals + u1v1.literals)  # u1v1|u0v0
+        The operands are split into three k-bit pieces, i.e., considered as polynomials u(x) and v(x) of degree 2
+        at x=2^k; w(x)=u(x)v(x) is computed at the points 0, 1, -1, -2 and infinity by five recursive products,
+        and the coefficients of w are found by Bodrato's interpolation sequence (with exact divisions by 2 and 3).
+        Signed values are represented in two's complement; the signed products are computed from the products
+        of the magnitudes.
 
-        mixed0 = mixed.clipped(self.n_bits).extended([xor_signs] * half_bits)
+        :param other: a SatInteger with more than 2k bits, but not longer than self
+        :param product: the function multiplying two (unsigned) SatIntegers (for the recursive products)
+        :param adder: the adder architecture (see sum_with())
+        """
+        mem = self.sat_memory
+        n_bits = self.n_bits + other.n_bits
+        k = (self.n_bits + 2) // 3
+        e_bits = k + 4  # the signed evaluations (from -2(2^k-1) to 5(2^k-1))
+        w_bits = 2 * k + 8  # the signed values during the interpolation (from -29*2^2k to 34*2^2k)
+
+        def evaluations(x):
+            # returns [x(0), x(1), x(-1), x(-2)] as e_bits-bit SatIntegers
+            x0, x1, x2 = [SatInteger(mem, x.literals[i * k:(i + 1) * k]).clipped(e_bits) for i in range(3)]
+            t = x0.sum_with(x2, adder)
+            x_1 = t.sum_with(x1, adder)
+            x_m1 = t.difference_with(x1, adder)
+            x_m2 = x_m1.sum_with(x2, adder).left_shifted(1).clipped(e_bits).difference_with(x0, adder)
+            return [x0, x_1, x_m1, x_m2]
+
+        def signed_product(a, b, magnitude_bits):
+            # returns a*b as a w_bits-bit SatInteger for the signed a and b with magnitudes of magnitude_bits bits
+            sign_a = a.literals[-1]
+            sign_b = b.literals[-1]
+            magnitude_a = a.conditional_negation(sign_a, adder).clipped(magnitude_bits)
+            magnitude_b = b.conditional_negation(sign_b, adder).clipped(magnitude_bits)
+            sign = XorGate(mem, [sign_a, sign_b]).simplified_literal()
+            return product(magnitude_a, magnitude_b).clipped(w_bits).conditional_negation(sign, adder)
+
+        u = evaluations(self)
+        v = evaluations(other)
+        w_0 = product(u[0].clipped(k), v[0].clipped(k)).clipped(w_bits)
+        w_1 = product(u[1].clipped(k + 2), v[1].clipped(k + 2)).clipped(w_bits)
+        w_m1 = signed_product(u[2], v[2], k + 1)
+        w_m2 = signed_product(u[3], v[3], k + 3)
+        w_inf = product(SatInteger(mem, self.literals[2 * k:]), SatInteger(mem, other.literals[2 * k:]))
+        w_inf = w_inf.clipped(w_bits)
+
+        # Bodrato's sequence for the coefficients r0..r4 of w
+        r3 = w_m2.difference_with(w_1, adder).divided_by_3()
+        r1 = w_1.difference_with(w_m1, adder).halved()
+        r2 = w_m1.difference_with(w_0, adder)
+        r3 = r2.difference_with(r3, adder).halved().sum_with(w_inf.left_shifted(1).clipped(w_bits), adder)
+        r2 = r2.sum_with(r1, adder).difference_with(w_inf, adder)
+        r1 = r1.difference_with(r3, adder)
+
+        # the coefficients are non-negative; thus, their lower bits are added (mod 2^n_bits)
+        return SatInteger.sum_of(mem, [w_0, r1.left_shifted(k), r2.left_shifted(2 * k), r3.left_shifted(3 * k),
+                                       w_inf.left_shifted(4 * k)], n_bits, adder)
+
+    def conditional_negation(self, sign, adder="ripple"):
+        """Returns -self, if the literal sign is True, or self otherwise (mod 2^n_bits), computed as
+        (self XOR sign) + sign."""
+        mem = self.sat_memory
+        inverted = SatInteger(mem, [XorGate(mem, [lit, sign]).simplified_literal() for lit in self.literals])
+        return inverted.sum_with(SatInteger(mem, [sign]).clipped(self.n_bits), adder)
+
+    def halved(self):
+        """Returns self/2 for the even two's complement self (the arithmetic right shift)."""
+        return SatInteger(self.sat_memory, self.literals[1:] + self.literals[-1:])
+
+    def divided_by_3(self):
+        """Returns self/3 (mod 2^n_bits) for self divisible by 3.
+
+        Since self = q + 2q for the quotient q, the bits of q are found from the lowest one: q_i = self_i XOR
+        q_(i-1) XOR c_(i-1), where c_i = MAJ(q_i, q_(i-1), c_(i-1)) is the carry of the sum q + 2q.
+        """
+        mem = self.sat_memory
+        result = [self.literals[0]]
+        carry = mem.false
+        for i in range(1, self.n_bits):
+            q_i = XorGate(mem, [self.literals[i], result[i - 1], carry]).simplified_literal()
+            if i < self.n_bits - 1:  # the next carry bit, ignoring the last one
+                carry = MajorityGate(mem, [q_i, result[i - 1], carry]).simplified_literal()
+            result.append(q_i)
+        return SatInteger(mem, result)
+
+    def schoolbook_product_with(self, other, adder="ripple", base_multiplier="array"):
+        """Returns the (self.n_bits + other.n_bits)-bit product self*other computed by the schoolbook method
+        from the rows (partial products) self*other[j] << j.
+
+        :param other:
+        :param adder: the adder architecture (see sum_with())
+        :param base_multiplier: "array" accumulates the rows one by one (by carry-propagate adders);
+            "wallace" and "dadda" reduce them by trees of carry-save adders (see sum_of() and dadda_sum_of())
+            and a single carry-propagate adder (more gates, but a lower depth)
+        """
+        n_bits = self.n_bits + other.n_bits
+        rows = []
+        for j in range(other.n_bits):
+            row = self.and_with(SatInteger(self.sat_memory, [other.literals[j]] * self.n_bits))
+            rows.append(row.left_shifted(j).clipped(n_bits))
+        if base_multiplier == "wallace":
+            return SatInteger.sum_of(self.sat_memory, rows, n_bits, adder)
+        if base_multiplier == "dadda":
+            return SatInteger.dadda_sum_of(self.sat_memory, rows, n_bits, adder)
+        if base_multiplier != "array":
+            raise Exception("Unknown base multiplier " + str(base_multiplier) + "; expected one of: " +
+                            ", ".join(SatInteger.BASE_MULTIPLIERS))
+        result = rows[0]
+        for row in rows[1:]:
+            result = result.sum_with(row, adder)
+        return result
 
-        mixed1 = mixed0.sum_with(u0v0.clipped(self.n_bits + half_bits))
-        mixed2 = mixed1.sum_with(u1v1.clipped(self.n_bits + half_bits))
-        mixed = SatInteger(self.sat_memory, [zero] * half_bits + mixed2.literals)
-        result = result.sum_with(mixed)
+    @staticmethod
+    def constant(sat_memory, value, n_bits):
+        """Returns the n_bits-bit SatInteger consisting of constants (the bits of value)."""
+        return SatInteger(sat_memory, [sat_memory.constant((value >> i) & 1 == 1) for i in range(n_bits)])
 
-        return result
+    @staticmethod
+    def sum_of(sat_memory, addends, n_bits, adder="ripple"):
+        """Returns the sum of the given SatIntegers modulo 2^n_bits.
+
+        The bits of the addends are collected into columns (by weight), which are reduced by carry-save adders
+        (3:2 compressors: XOR3 for the sum bit, and MAJ3 for the carry bit added to the next column) until each
+        column has at most 2 bits; the two remaining rows are added by a single carry-propagate (ripple-carry)
+        adder. Constant False bits (e.g., of shifted addends) are skipped.
+
+        :param sat_memory:
+        :param addends: SatInteger instances (zero-extended or truncated to n_bits)
+        :param n_bits: the number of bits of the result
+        :param adder: the carry-propagate adder architecture (see sum_with())
+        """
+        columns = [[] for _ in range(n_bits)]
+        for a in addends:
+            for k, lit in enumerate(a.literals[:n_bits]):
+                if not (lit.is_constant() and not lit.value):
+                    columns[k].append(lit)
+
+        while max(len(column) for column in columns) > 2:
+            reduced = [[] for _ in range(n_bits)]
+            for k, column in enumerate(columns):
+                i = 0
+                while len(column) - i >= 3:
+                    x, y, z = column[i:i + 3]
+                    i += 3
+                    reduced[k].append(XorGate(sat_memory, [x, y, z]).simplified_literal())
+                    if k + 1 < n_bits:
+                        reduced[k + 1].append(MajorityGate(sat_memory, [x, y, z]).simplified_literal())
+                reduced[k].extend(column[i:])
+            columns = reduced
+
+        zero = sat_memory.false
+        row0 = SatInteger(sat_memory, [column[0] if len(column) > 0 else zero for column in columns])
+        row1 = SatInteger(sat_memory, [column[1] if len(column) > 1 else zero for column in columns])
+        return row0.sum_with(row1, adder)
+
+    @staticmethod
+    def dadda_sum_of(sat_memory, addends, n_bits, adder="ripple"):
+        """Returns the sum of the given SatIntegers modulo 2^n_bits reduced by the Dadda schedule.
+
+        The bits of the addends are collected into columns (as in sum_of()), and the columns are reduced in
+        stages to the heights ..., 13, 9, 6, 4, 3, 2 (d_1 = 2, d_(j+1) = floor(1.5*d_j)). In each stage, only the
+        columns higher than the target are reduced (from the lowest column), by as few full adders (3:2) and
+        half adders (2:2) as possible. The carries from the previous column produced in the same stage count
+        towards the height of the column, but they are reduced only in the next stage, so each stage adds a
+        single level of adders. The two remaining rows are added by a single carry-propagate adder.
+
+        :param sat_memory:
+        :param addends: SatInteger instances (zero-extended or truncated to n_bits)
+        :param n_bits: the number of bits of the result
+        :param adder: the carry-propagate adder architecture (see sum_with())
+        """
+        columns = [[] for _ in range(n_bits)]
+        for a in addends:
+            for k, lit in enumerate(a.literals[:n_bits]):
+                if not (lit.is_constant() and not lit.value):
+                    columns[k].append(lit)
+
+        targets = [2]
+        while targets[-1] < max(len(column) for column in columns):
+            targets.append(targets[-1] * 3 // 2)
+        for d in reversed(targets[:-1]):
+            carries = []  # the carries into the column k produced in this stage
+            for k in range(n_bits):
+                pending = columns[k]
+                reduced = []
+                next_carries = []
+                while len(pending) + len(reduced) + len(carries) > d:
+                    if len(pending) < 2:
+                        raise Exception("column " + str(k) + " cannot be reduced to the height " + str(d))
+                    # a half adder reduces the height by 1, a full adder by 2
+                    half = len(pending) == 2 or len(pending) + len(reduced) + len(carries) == d + 1
+                    operands = pending[:2] if half else pending[:3]
+                    pending = pending[len(operands):]
+                    reduced.append(XorGate(sat_memory, operands).simplified_literal())
+                    if k + 1 < n_bits:
+                        carry = And(sat_memory, operands) if len(operands) == 2 else MajorityGate(sat_memory, operands)
+                        next_carries.append(carry.simplified_literal())
+                columns[k] = reduced + pending + carries
+                carries = next_carries
+
+        zero = sat_memory.false
+        row0 = SatInteger(sat_memory, [column[0] if len(column) > 0 else zero for column in columns])
+        row1 = SatInteger(sat_memory, [column[1] if len(column) > 1 else zero for column in columns])
+        return row0.sum_with(row1, adder)
 
     def __str__(self):
         try:
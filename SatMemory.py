@@ -5,16 +5,20 @@ from SatFormula import *
 
 class SatMemory:
     # literal indices start from 1, e.g., 1 for x1 and -2 for not(x2)
+    # formulas are hash-consed by their keys (see SatFormula.key()): an integer for a literal,
+    # "True"/"False" for a constant, and an (operator, operand keys...) tuple for compound formulas
 
     def __init__(self, n_free_vars):
         self.next_index = 1
         self.n_free_vars = n_free_vars
-        self.literals = {}  # serialized formula -> Literal instance
-        self.reduced_formulas = {}  # serialized literal -> formula, for which we introduced the literal
+        self.true = Constant(self, True)  # shared constants
+        self.false = Constant(self, False)
+        self.literals = {}  # formula key -> Literal instance
+        self.reduced_formulas = {}  # signed literal index -> formula, for which we introduced the literal
         for i in range(1, n_free_vars+1):
             self.allocate()
         self.values = {}
-        self.clear_values()  # self.values: serialized formula -> computed/assigned value
+        self.clear_values()  # self.values: formula key -> computed/assigned value
 
     def clear_values(self):
         self.values = {}
@@ -22,59 +26,67 @@ class SatMemory:
         self.assign("False", False)
         pass
 
-    def is_free_var(self, var_name):
-        index = int(var_name[1:])
-        return (1 <= index) and (index <=self.n_free_vars)
+    def is_free_var(self, index):
+        return (1 <= index) and (index <= self.n_free_vars)
 
     def allocate(self):
         # returns a Literal instance; always creates 2 literals
-        var_name = "x" + str(self.next_index)  # new binary variable
+        index = self.next_index  # new binary variable
         self.next_index += 1
-        pos_literal = Literal(self, False, var_name)
-        neg_literal = Literal(self, True, var_name)
-        self.literals[str(pos_literal)] = pos_literal
-        self.literals[str(neg_literal)] = neg_literal
+        pos_literal = Literal(self, False, index)
+        neg_literal = Literal(self, True, index)
+        self.literals[index] = pos_literal
+        self.literals[-index] = neg_literal
         return pos_literal
 
     def allocate_for(self, formula):
         # returns either a positive or a negative Literal instance depending on
         # whether the formula is a negation; there will be 2 literals for each SAT memory bit
-        s = str(formula)
-        if s in self.literals:
-            return self.literals[s]
-        var_name = "x" + str(self.next_index)  # new binary variable
+        key = formula.key()
+        if key in self.literals:
+            return self.literals[key]
+        index = self.next_index  # new binary variable
         self.next_index += 1
         if formula.is_negation():
-            pos_literal = Literal(self, False, var_name)
-            neg_literal = Literal(self, True, var_name, formula)
+            pos_literal = Literal(self, False, index)
+            neg_literal = Literal(self, True, index, formula)
             ret_val = neg_literal
         else:
-            pos_literal = Literal(self, False, var_name, formula)
-            neg_literal = Literal(self, True, var_name)
+            pos_literal = Literal(self, False, index, formula)
+            neg_literal = Literal(self, True, index)
             ret_val = pos_literal
 
-        self.literals[str(formula)] = pos_literal
-        self.literals[str(pos_literal)] = pos_literal
-        self.literals[str(neg_literal)] = neg_literal
+        self.literals[key] = pos_literal
+        self.literals[index] = pos_literal
+        self.literals[-index] = neg_literal
         return ret_val
 
-    def assign(self, formula_str, val):
-        self.values[formula_str] = val
-
-    def assigned(self, formula_str):
-        return formula_str in self.values
-
-    def literal(self, str):
-        if str == "True":
-            return Constant(self, True)
-        elif str == "False":
-            return Constant(self, False)
+    @staticmethod
+    def key_of(formula):
+        # accepts either a formula, or a serialized literal/constant (e.g., "x5", "-x5", "True")
+        if not isinstance(formula, str):
+            return formula.key()
+        if formula == "True" or formula == "False":
+            return formula
+        if formula[0] == "-":
+            return -int(formula[2:])
+        return int(formula[1:])
+
+    def assign(self, formula, val):
+        self.values[SatMemory.key_of(formula)] = val
+
+    def assigned(self, formula):
+        return SatMemory.key_of(formula) in self.values
+
+    def literal(self, formula):
+        # accepts either a Literal/Constant instance, or its serialized form (e.g., "x5", "-x5", "True")
+        key = SatMemory.key_of(formula)
+        if key == "True":
+            return self.true
+        elif key == "False":
+            return self.false
         else:
-            return self.literals[str]
-
-
-
-
-
-
+            return self.literals[key]
 
+    def constant(self, value):
+        return self.true if value else self.false
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import random
+
+from SatFormula import *
+from CircuitSimulator import CircuitSimulator
+
+try:
+    from pysat.solvers import Solver
+except ImportError:
+    Solver = None
+
+
+class SatSweeper:
+    """Merges the functionally equivalent nodes of the circuit built in a SatMemory (SAT sweeping).
+
+    Hash-consing in SatMemory shares only the structurally equal formulas, while the arithmetic circuits contain
+    many nodes computing the same function in different ways (e.g., in the Karatsuba differences and in the
+    comparator of the factors). The candidate equivalences are found by simulation: the nodes are partitioned into
+    classes by their values on random assignments (a node and its negation are in the same class, as well as the
+    nodes simulated as constants). Then, each node is compared with the representative of its class (the constant,
+    or the node with the smallest variable index) by a SAT solver with a conflict budget. The counterexamples are
+    simulated in the next round, which refines the classes of the nodes not merged yet.
+
+    The circuit is rebuilt in the same SatMemory with the merged nodes replaced by their representatives (by
+    hash-consing, the gates, the operands of which have become equal, are merged as well); the nodes not used
+    anymore are not expanded into CNF.
+    """
+
+    MAX_CONFLICTS = 100  # the budget of a single equivalence check (an undecided check does not merge the nodes)
+    MAX_ROUNDS = 10
+
+    def __init__(self, sat_memory, outputs, n_patterns=1024, seed=0):
+        """
+
+        :param sat_memory: the SatMemory, in which the circuit has been built
+        :param outputs: the formulas to be computed (literals or And/Or formulas of literals)
+        :param n_patterns: the number of random assignments simulated initially
+        :param seed: the seed of the random assignments
+        """
+        if Solver is None:
+            raise Exception("SAT sweeping requires the python-sat library (pip3 install python-sat)")
+        self.sat_memory = sat_memory
+        self.outputs = outputs
+        self.simulator = CircuitSimulator(sat_memory, outputs)
+        self.n_patterns = n_patterns
+        self.rng = random.Random(seed)
+        self.replacements = {}  # variable index -> (the representative slot, inverted); slot 0 is the constant False
+        self.n_checks = 0
+
+    def signatures(self, inputs, width):
+        # slot -> the values of the node for the given assignments
+        values, ones = self.simulator.evaluate(inputs, width)
+        return [CircuitSimulator.as_int(w) for w in values]
+
+    def sat_variable(self, operand):
+        # the solver variable for the (slot, inverted) operand; slot 0 (the constant False) gets variable 1
+        slot, inverted = operand
+        return -(slot + 1) if inverted else slot + 1
+
+    def add_gate_clauses(self, solver):
+        solver.add_clause([-1])
+        for slot, operator, operands, inverted in self.simulator.gates:
+            z = self.sat_variable((slot, inverted))  # z <=> operator(operands)
+            xs = [self.sat_variable(o) for o in operands]
+            if operator == CircuitSimulator.AND:
+                solver.add_clause([z] + [-x for x in xs])
+                for x in xs:
+                    solver.add_clause([-z, x])
+            elif operator == CircuitSimulator.OR:
+                solver.add_clause([-z] + xs)
+                for x in xs:
+                    solver.add_clause([z, -x])
+            elif operator == CircuitSimulator.XOR:
+                for assignment in range(1 << len(xs)):
+                    parity = bin(assignment).count("1") % 2 == 1
+                    solver.add_clause([-x if (assignment >> i) & 1 else x for i, x in enumerate(xs)] +
+                                      [z if parity else -z])
+            else:
+                a, b, c = xs
+                for x, y in ((a, b), (a, c), (b, c)):
+                    solver.add_clause([-x, -y, z])
+                    solver.add_clause([x, y, -z])
+
+    def check(self, solver, a, b):
+        """Checks whether the solver variables (or literals) a and b are equivalent.
+
+        :return: True, if proven; the counterexample (variable index -> value), if refuted; None, if undecided
+        """
+        for assumptions in ([a, -b], [-a, b]):
+            self.n_checks += 1
+            solver.conf_budget(SatSweeper.MAX_CONFLICTS)
+            result = solver.solve_limited(assumptions=assumptions)
+            if result is None:
+                return None
+            if result:
+                model = set(solver.get_model())
+                return {v: (slot + 1) in model for v, slot in self.simulator.inputs.items()}
+        solver.add_clause([-a, b])  # helps the subsequent checks
+        solver.add_clause([a, -b])
+        return True
+
+    def find_equivalences(self):
+        """Fills self.replacements with the proven equivalences; returns the number of rounds."""
+        simulator = self.simulator
+        variables = sorted((slot for slot, key in enumerate(simulator.slot_keys) if isinstance(key, int)),
+                           key=lambda slot: simulator.slot_keys[slot])
+        width = self.n_patterns
+        inputs = {v: self.rng.getrandbits(width) for v in simulator.inputs}
+        signatures = self.signatures(inputs, width)
+        candidates = set(variables)
+
+        with Solver(name="minisat22") as solver:
+            self.add_gate_clauses(solver)
+            for i in range(SatSweeper.MAX_ROUNDS):
+                # the classes of the nodes by their signatures (up to the negation)
+                mask = (1 << width) - 1
+                classes = {0: [0]}  # the class of the constants
+                for slot in variables:
+                    s = signatures[slot]
+                    classes.setdefault(s ^ mask if s & 1 else s, []).append(slot)
+
+                counterexamples = []
+                for members in classes.values():
+                    representative = members[0]
+                    for slot in members[1:]:
+                        if slot not in candidates:
+                            continue
+                        inverted = (signatures[slot] & 1) != (signatures[representative] & 1)
+                        result = self.check(solver, slot + 1, -(representative + 1) if inverted else representative + 1)
+                        if result is None:
+                            candidates.discard(slot)
+                        elif result is True:
+                            self.replacements[simulator.slot_keys[slot]] = (representative, inverted)
+                            candidates.discard(slot)
+                        else:
+                            counterexamples.append(result)
+                if len(counterexamples) == 0:
+                    return i + 1
+
+                # refining the classes by the counterexamples
+                inputs = {v: sum(1 << j for j, c in enumerate(counterexamples) if c[v]) for v in simulator.inputs}
+                new_signatures = self.signatures(inputs, len(counterexamples))
+                signatures = [s | (t << width) for s, t in zip(signatures, new_signatures)]
+                width += len(counterexamples)
+        return SatSweeper.MAX_ROUNDS
+
+    def rebuilt(self, f, new_literals):
+        # the formula f with the literals replaced by new_literals (variable index -> the new positive literal)
+        if f.is_constant():
+            return f
+        if f.is_literal():
+            lit = new_literals[f.index]
+            return lit.inverse() if f.is_negation() else lit
+        if any(not o.is_literal() and not o.is_constant() for o in f.operands):
+            raise Exception("the operands of " + str(f) + " must be literals")
+        operands = [self.rebuilt(o, new_literals) for o in f.operands]
+        if all(o is oo for o, oo in zip(operands, f.operands)):
+            return f
+        if f.is_negation():
+            return Not(self.sat_memory, operands[0])
+        if f.is_and():
+            return And(self.sat_memory, operands)
+        if f.is_or():
+            return Or(self.sat_memory, operands)
+        if f.is_xor():
+            return XorGate(self.sat_memory, operands)
+        if f.is_majority():
+            return MajorityGate(self.sat_memory, operands)
+        raise Exception("unknown formula: " + str(f))
+
+    def sweep(self):
+        """Finds and merges the equivalent nodes.
+
+        :return: the outputs of the rebuilt circuit (corresponding to the given outputs)
+        """
+        rounds = self.find_equivalences()
+        simulator = self.simulator
+        mem = self.sat_memory
+        new_literals = {}  # variable index -> the positive literal replacing it
+        # the variables are rebuilt in the order of their indices, which is topological (the representatives
+        # and the operands are allocated before the nodes using them)
+        for v in sorted(key for key in simulator.slot_keys if isinstance(key, int)):
+            if v in self.replacements:
+                representative, inverted = self.replacements[v]
+                if representative == 0:
+                    lit = mem.constant(inverted)
+                else:
+                    lit = new_literals[simulator.slot_keys[representative]]
+                    lit = lit.inverse() if inverted else lit
+            else:
+                node = mem.literals[v]
+                formula, inverted = simulator.definition(node)
+                if formula is None:
+                    lit = node
+                else:
+                    f = self.rebuilt(formula, new_literals)
+                    lit = node if f is formula else f.simplified_literal()
+                    lit = lit.inverse() if inverted and f is not formula else lit
+            new_literals[v] = lit
+
+        n_constants = sum(1 for representative, _ in self.replacements.values() if representative == 0)
+        print("swept: #nodes " + str(len(new_literals)) + ", #merged " + str(len(self.replacements)) +
+              " (" + str(n_constants) + " constants), #SAT checks " + str(self.n_checks) + ", #rounds " + str(rounds))
+        return [self.rebuilt(f, new_literals) for f in self.outputs]
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
-import sys  # for argv
+import argparse
+import multiprocessing
+import queue
+import random
+import time
+from array import array
+from multiprocessing import shared_memory
 
-from pysat.solvers import Solver
+from pysat.solvers import Solver, SolverNames
 
 from SatMemory import SatMemory
 from SatInteger import SatInteger
@@ -11,27 +17,227 @@ from CNF import CNF
 from BitUtils import *
 from DimacsFile import DimacsFile
 
+BATCH_SIZE = 10000  # the number of clauses passed to the solver at once (streaming and portfolio modes)
+SOLVERS = ["cadical153", "glucose3", "glucose4"]
+POLL_SECONDS = 1  # how often the portfolio checks whether its processes are still alive
+
+
+def new_solver(name, df, stream):
+    """Creates a solver with the clauses from df: either the loaded ones, or (if stream is True) the ones
+    read from the file batch by batch, without keeping them in memory.
+
+    :return: (solver, the number of clauses passed to the solver)
+    """
+    if not stream:
+        return Solver(name=name, bootstrap_with=df.iter_stored_clauses(), use_timer=True), df.number_of_clauses()
+    solver = Solver(name=name, use_timer=True)
+    n_clauses = 0
+    for batch in df.iter_clauses(batch_size=BATCH_SIZE):
+        solver.append_formula(batch)
+        n_clauses += len(batch)
+    return solver, n_clauses
+
+
+def share_clauses(df):
+    """Copies the loaded clauses of df (the flat literals and offsets arrays) into shared memory blocks,
+    which are attached by the portfolio processes instead of passing them the clauses.
+
+    :return: (shared memory blocks, the description of the blocks to be passed to append_shared_clauses())
+    """
+    blocks = []
+    for a in (df.literals, df.offsets):
+        data = a.tobytes()
+        block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        block.buf[:len(data)] = data
+        blocks.append(block)
+    return blocks, (blocks[0].name, len(df.literals), blocks[1].name, len(df.offsets))
+
+
+def append_shared_clauses(solver, shared, seed=0):
+    """Passes the clauses from the shared memory blocks created by share_clauses() to the solver in batches of
+    BATCH_SIZE clauses and detaches the blocks. The clauses are passed as slices of the shared literals,
+    so the process does not copy the formula.
+
+    :param seed: if non-zero, the clauses are passed in the order shuffled by this seed
+    :return: the number of clauses passed to the solver
+    """
+    literals_name, n_literals, offsets_name, n_offsets = shared
+    n_clauses = n_offsets - 1
+    blocks = []
+    views = []
+    batch = None
+    try:
+        blocks.append(shared_memory.SharedMemory(name=literals_name))
+        blocks.append(shared_memory.SharedMemory(name=offsets_name))
+        views.append(blocks[0].buf.cast('i'))
+        views.append(blocks[1].buf.cast('q'))
+        literals, offsets = views
+        order = None
+        if seed != 0:
+            order = array('q', range(n_clauses))  # a permutation of the clause indices
+            random.Random(seed).shuffle(order)
+        for start in range(0, n_clauses, BATCH_SIZE):
+            indices = range(start, min(start + BATCH_SIZE, n_clauses)) if order is None \
+                else order[start:start + BATCH_SIZE]
+            batch = [literals[offsets[j]:offsets[j + 1]] for j in indices]
+            solver.append_formula(batch)
+    finally:
+        # the slices and the views must be released before the blocks are closed
+        batch = None
+        for view in views:
+            view.release()
+        for block in blocks:
+            block.close()
+    return n_clauses
+
+
+def parse_configurations(configurations):
+    """Checks the portfolio configurations before any process is started.
+
+    :param configurations: "<solver name>" or "<solver name>:<seed>" strings (see portfolio_worker())
+    :return: the list of (solver name, seed)
+    """
+    known_names = set(name for names in vars(SolverNames).values() if isinstance(names, tuple) for name in names)
+    parsed = []
+    for c in configurations:
+        name, _, seed = c.partition(":")
+        if name not in known_names:
+            raise Exception("unknown solver " + name + " in the portfolio configuration " + c)
+        try:
+            seed = int(seed or 0)
+        except ValueError:
+            raise Exception("the seed in the portfolio configuration " + c + " must be an integer")
+        if (name, seed) in parsed:
+            raise Exception("duplicate portfolio configuration " + c)
+        parsed.append((name, seed))
+    return parsed
+
+
+def portfolio_worker(index, name, seed, shared, results):
+    """Solves the shared clauses by the given solver and puts messages (index, kind, data) into the results queue:
+    (index, "solving", the time the solver started solving), followed by
+    (index, "result", (is_sat, model, solve time, total time)), or (index, "error", the error message) on failure.
+
+    :param seed: if non-zero, the clauses are passed to the solver in the order shuffled by this seed
+        (the solvers break ties by the clause order, so such configurations explore the search space differently)
+    """
+    start = time.time()
+    try:
+        with Solver(name=name, use_timer=True) as solver:
+            append_shared_clauses(solver, shared, seed)
+            results.put((index, "solving", time.time()))
+            is_sat = solver.solve()
+            results.put((index, "result", (is_sat, solver.get_model(), solver.time(), time.time() - start)))
+    except Exception as e:
+        results.put((index, "error", type(e).__name__ + ": " + str(e)))
+
+
+def solve_portfolio(df, configurations):
+    """Runs the solver configurations in parallel processes; returns the first result and terminates the others.
+
+    :param df: a DimacsFile with the loaded clauses
+    :param configurations: "<solver name>" or "<solver name>:<seed>" strings (see portfolio_worker())
+    :return: (the winning configuration, is_sat, model)
+    """
+    parsed = parse_configurations(configurations)
+    blocks, shared = share_clauses(df)
+    results = multiprocessing.Queue()
+    processes = []
+    solving_since = {}  # configuration index -> the time the solver started solving
+    try:
+        for i, (name, seed) in enumerate(parsed):
+            processes.append(multiprocessing.Process(target=portfolio_worker, args=(i, name, seed, shared, results),
+                                                     daemon=True))
+            processes[-1].start()
+        n_failed = 0
+        while True:
+            # the result of a process is in the queue before the process exits, so if all the processes have
+            # exited before the queue turns out to be empty, none of them has produced a result
+            all_exited = all(not p.is_alive() for p in processes)
+            try:
+                message = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                message = None
+            if message is None:
+                if all_exited:
+                    raise Exception("all the portfolio solvers have failed (exit codes: " +
+                                    ", ".join(str(p.exitcode) for p in processes) + ")")
+                continue
+            i, kind, data = message
+            if kind == "solving":
+                solving_since[i] = data
+            elif kind == "error":
+                print(configurations[i] + " failed: " + data)
+                n_failed += 1
+                if n_failed == len(processes):
+                    raise Exception("all the portfolio solvers have failed")
+            else:
+                break
+        is_sat, model, solve_time, total_time = data
+        winner = configurations[i]
+        print(winner + " won: " + str(is_sat) + " " + '{0:.4f}s'.format(solve_time) + " solving, " +
+              '{0:.4f}s'.format(total_time) + " total")
+        now = time.time()
+        finished = {i}
+        while True:  # the messages of the other processes sent before the first result was received
+            try:
+                j, kind, data = results.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if kind == "solving":
+                solving_since[j] = data
+            elif kind == "error":
+                print(configurations[j] + " failed: " + data)
+                finished.add(j)
+            else:
+                print(configurations[j] + " finished too: " + '{0:.4f}s'.format(data[2]) + " solving")
+                finished.add(j)
+        for j, c in enumerate(configurations):
+            if j in finished or processes[j].exitcode is not None:
+                continue
+            if j in solving_since:
+                print(c + " terminated after " + '{0:.4f}s'.format(now - solving_since[j]) + " solving")
+            else:
+                print(c + " terminated while loading the clauses")
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        for p in processes:
+            p.join()
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return winner, is_sat, model
+
+
 if __name__ == "__main__":
 
-    if len(sys.argv) < 2:
-        print("Usage: " + sys.argv[0] + " <fileName.dimacs>")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", metavar="fileName.dimacs")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the clauses batch by batch for each solver instead of loading them into memory")
+    parser.add_argument("--portfolio", nargs="*", metavar="SOLVER[:SEED]",
+                        help="run the solvers (default: " + " ".join(SOLVERS) + ") in parallel processes "
+                             "sharing the loaded clauses and report the first result; a non-zero seed shuffles "
+                             "the order of the clauses for that solver")
+    args = parser.parse_args()
+    if args.stream and args.portfolio is not None:
+        parser.error("--portfolio loads the clauses into shared memory; it cannot be combined with --stream")
+
+    df = DimacsFile(args.filename)
+    if not args.stream:
+        df.load()
+        print("#vars="+str(df.number_of_vars())+" #clauses="+str(df.number_of_clauses()))
+
+    if args.portfolio is not None:
+        winner, is_sat, model = solve_portfolio(df, args.portfolio or SOLVERS)
+        print(model)
         exit(0)
-        
-    df = DimacsFile(sys.argv[1])
-    df.load()
-    clauses = df.clauses()
-    
-    print("#vars="+str(df.number_of_vars())+" #clauses="+str(df.number_of_clauses()))
-
-    with Solver(name="Cadical", bootstrap_with=clauses, use_timer=True) as solver:
-        is_sat = solver.solve()
-        print("Cadical result: ", is_sat, '{0:.4f}s'.format(solver.time()), len(clauses), " clauses")
-        print(solver.get_model())
-    with Solver(name="Glucose3", bootstrap_with=clauses, use_timer=True) as solver:
-        is_sat = solver.solve()
-        print("Gluecose3 result: ", is_sat, '{0:.4f}s'.format(solver.time()), len(clauses), " clauses")
-    print(solver.get_model())
-    with Solver(name="Glucose4", bootstrap_with=clauses, use_timer=True) as solver:
-        is_sat = solver.solve()
-        print("Gluecose4 result: ", is_sat, '{0:.4f}s'.format(solver.time()), len(clauses), " clauses")
-        print(solver.get_model())
+
+    for name in SOLVERS:
+        solver, n_clauses = new_solver(name, df, args.stream)
+        with solver:
+            is_sat = solver.solve()
+            print(name + " result: ", is_sat, '{0:.4f}s'.format(solver.time()), n_clauses, " clauses")
+            print(solver.get_model())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+
+class VariableRenumbering:
+    """Renumbers the variables of the clauses passed through it densely.
+
+    SatMemory allocates variables for all the formulas built, including the ones that are simplified away later
+    or never expanded, and CnfSimplifier removes variables while keeping the names of the others. Since solvers
+    size their arrays by the largest variable index, the variables actually occurring in the clauses are
+    renumbered to 1, 2, ... in the order of their first occurrence (i.e., in the order, in which the CNF
+    expansion visits the gates, so that the variables of the neighbouring gates get close indices).
+    The first n_fixed variables (the bits of the factors) keep their indices.
+
+    Can be used as a clause sink (e.g., for CNF.store_clauses()) wrapping another sink (e.g., a DimacsWriter).
+    """
+
+    def __init__(self, sink=None, n_fixed=0):
+        """
+
+        :param sink: the object, the add_clause() of which receives the renumbered clauses
+        :param n_fixed: the variables 1..n_fixed keep their indices
+        """
+        self.sink = sink
+        self.n_fixed = n_fixed
+        self.new_indices = {}  # original variable index -> new variable index
+        self.original_indices = list(range(n_fixed + 1))  # new variable index -> original variable index
+
+    def variable(self, v):
+        """Returns the new index of the variable with the original index v (assigning the next index on the first
+        call)."""
+        if v <= self.n_fixed:
+            return v
+        i = self.new_indices.get(v)
+        if i is None:
+            i = len(self.original_indices)
+            self.new_indices[v] = i
+            self.original_indices.append(v)
+        return i
+
+    def literal(self, lit):
+        return self.variable(lit) if lit > 0 else -self.variable(-lit)
+
+    def add_clause(self, clause):
+        self.sink.add_clause([self.literal(i) for i in clause])
+
+    def add_clauses(self, clauses):
+        for c in clauses:
+            self.add_clause(c)
+
+    def number_of_vars(self):
+        return len(self.original_indices) - 1
+
+    def original_model(self, model):
+        """Maps a model of the renumbered clauses (a list of non-zero literals, e.g., returned by pysat's
+        get_model()) to the original variable indices."""
+        return [self.original_indices[i] if i > 0 else -self.original_indices[-i]
+                for i in model if abs(i) < len(self.original_indices)]